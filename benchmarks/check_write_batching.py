@@ -0,0 +1,75 @@
+"""Check that WRITE_BATCHING groups concurrent POST /expenses requests into shared insert_many calls.
+
+expense-service is started in this process against mongomock, set up to hand out a new Collection object
+every time a collection is looked up (as pymongo does), and sent concurrent POST /expenses requests. The
+check fails unless every request succeeds, every expense is stored and at least one batch holds more than one
+expense.
+
+    python benchmarks/check_write_batching.py --requests 200 --concurrency 16
+"""
+import argparse
+import logging
+import os
+import sys
+
+from mongomock.collection import Collection
+
+from run_benchmarks import expense_body, load_service, run_endpoint, start_server
+
+
+# Database wrapper that returns a new Collection object for every attribute access, like pymongo's Database
+class FreshCollections:
+    def __init__(self, database):
+        self.database = database
+
+    def __getattr__(self, name):
+        return Collection(self.database, name, self.database._store)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200, help="expenses to post (default 200)")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent clients (default 16)")
+    parser.add_argument("--window-ms", default="20", help="WRITE_BATCH_WINDOW_MS to use (default 20)")
+    args = parser.parse_args()
+
+    # Settings read by the service when it is imported
+    os.environ["WRITE_BATCHING"] = "true"
+    os.environ["WRITE_BATCH_WINDOW_MS"] = args.window_ms
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+
+    module = load_service("expense-service", "expense_service_app")
+    app = module.create_app({"MONGO_URI": "mongodb://localhost", "MONGO_CREATE_INDEXES": False})
+    database = module.get_db
+    module.get_db = lambda: FreshCollections(database())
+
+    batch_sizes = []
+    write_insert_batch = module.write_insert_batch
+
+    def record_batch(batch):
+        batch_sizes.append(len(batch.expenses))
+        write_insert_batch(batch)
+
+    module.write_insert_batch = record_batch
+
+    server = start_server(app)
+    try:
+        stats = run_endpoint(server.server_port, lambda i: ("POST", "/expenses", expense_body(i), None),
+                             args.requests, args.concurrency)
+    finally:
+        server.shutdown()
+
+    with app.app_context():
+        stored = module.expenses_collection.count_documents({})
+
+    print(f"{args.requests} requests, {len(batch_sizes)} batches, largest batch {max(batch_sizes, default=0)}, "
+          f"{stored} expenses stored, status codes {stats['status_codes']}")
+    if stats["errors"] or stored != args.requests:
+        sys.exit("FAILED: not every expense was stored")
+    if max(batch_sizes, default=0) < 2:
+        sys.exit("FAILED: concurrent inserts were not batched")
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
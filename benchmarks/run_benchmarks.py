@@ -0,0 +1,316 @@
+"""Load-test every route of expense-service and user-service.
+
+Both services are started in this process on local ports, backed by an in-memory
+MongoDB stand-in (mongomock), seeded with the requested amount of data and then
+driven with concurrent HTTP clients, one route at a time. Throughput and latency
+percentiles per route are printed and written to a JSON file so runs can be
+compared over time.
+
+    python benchmarks/run_benchmarks.py --expenses 10000 --users 100 --requests 200 --concurrency 8
+"""
+import argparse
+import http.client
+import importlib.util
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import bcrypt
+import mongomock
+from werkzeug.serving import make_server
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CATEGORIES = ["Food", "Rent", "Transport", "Fun", "Health", "Bills"]
+PASSWORD = "password"
+
+
+# Load a service's app.py as its own module, with MongoDB replaced by mongomock
+def load_service(service, module_name):
+    service_dir = os.path.join(ROOT, service)
+    # Both services have a metrics module; make sure each app imports its own
+    sys.modules.pop("metrics", None)
+    sys.path.insert(0, service_dir)
+    try:
+        spec = importlib.util.spec_from_file_location(module_name, os.path.join(service_dir, "app.py"))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    finally:
+        sys.path.remove(service_dir)
+    # Separate mongomock clients don't share data, so hand out the same one for every MongoClient(...) call
+    client = mongomock.MongoClient()
+    module.MongoClient = lambda *args, **kwargs: client
+    return module
+
+
+# Serve a Flask app on a free local port from a background thread
+def start_server(app):
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+# Send `requests` requests built by make_request(i) -> (method, path, body, headers) from `concurrency` threads
+def run_endpoint(port, make_request, requests, concurrency):
+    latencies = [None] * requests
+    statuses = {}
+    status_lock = threading.Lock()
+
+    def send(i):
+        method, path, body, headers = make_request(i)
+        headers = dict(headers or {})
+        if body is not None and not isinstance(body, (bytes, str)):
+            body = json.dumps(body)
+            headers.setdefault("Content-Type", "application/json")
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+        started = time.perf_counter()
+        try:
+            connection.request(method, path, body=body, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            status = response.status
+        except Exception:
+            status = "error"
+        finally:
+            latencies[i] = time.perf_counter() - started
+            connection.close()
+        with status_lock:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(send, range(requests)))
+    elapsed = time.perf_counter() - started
+
+    ordered = sorted(latencies)
+    errors = sum(count for status, count in statuses.items() if not status.startswith("2"))
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 4),
+        "throughput_rps": round(requests / elapsed, 2),
+        "latency_ms": {
+            "mean": round(sum(ordered) / len(ordered) * 1000, 3),
+            "p50": round(percentile(ordered, 0.50) * 1000, 3),
+            "p95": round(percentile(ordered, 0.95) * 1000, 3),
+            "p99": round(percentile(ordered, 0.99) * 1000, 3),
+            "max": round(ordered[-1] * 1000, 3)
+        },
+        "status_codes": statuses,
+        "errors": errors
+    }
+
+
+def make_expense(i):
+    day = datetime(2024, 1, 1) + timedelta(days=i % 365)
+    return {
+        "description": f"Expense {i}",
+        "amount": float(i % 500) + 0.99,
+        "category": CATEGORIES[i % len(CATEGORIES)],
+        "date": day
+    }
+
+
+def expense_body(i):
+    expense = make_expense(i)
+    expense["date"] = expense["date"].date().isoformat()
+    return expense
+
+
+def seed_expenses(module, app, count):
+    with app.app_context():
+        chunk = []
+        for i in range(count):
+            chunk.append(make_expense(i))
+            if len(chunk) == 10000:
+                module.expenses_collection.insert_many(chunk)
+                chunk = []
+        if chunk:
+            module.expenses_collection.insert_many(chunk)
+        module.expenses_collection.aggregate(module.ROLLUP_PIPELINE)
+        return [expense["_id"] for expense in module.expenses_collection.find({}, {"_id": 1}).limit(1000)]
+
+
+def insert_expenses(module, app, count, offset):
+    with app.app_context():
+        result = module.expenses_collection.insert_many([make_expense(offset + i) for i in range(count)])
+        return result.inserted_ids
+
+
+def bench_expense_service(args, log):
+    module = load_service("expense-service", "expense_service_app")
+    app = module.create_app({"MONGO_URI": "mongodb://localhost"})
+    log(f"Seeding {args.expenses} expenses...")
+    ids = seed_expenses(module, app, args.expenses)
+    delete_ids = insert_expenses(module, app, args.requests, args.expenses)
+    server = start_server(app)
+    port = server.server_port
+
+    def by_id(i):
+        return str(ids[i % len(ids)])
+
+    endpoints = [
+        ("GET /", lambda i: ("GET", "/", None, None)),
+        ("GET /ready", lambda i: ("GET", "/ready", None, None)),
+        ("GET /expenses", lambda i: ("GET", "/expenses?limit=50", None, None)),
+        ("GET /expenses (filtered, sorted by date)", lambda i: (
+            "GET", f"/expenses?category={CATEGORIES[i % len(CATEGORIES)]}&from=2024-03-01&to=2024-06-30&sort=-date",
+            None, None)),
+        ("GET /expenses/summary", lambda i: ("GET", "/expenses/summary", None, None)),
+        ("GET /expenses/export (one category, gzip)", lambda i: (
+            "GET", f"/expenses/export?category={CATEGORIES[i % len(CATEGORIES)]}", None, {"Accept-Encoding": "gzip"})),
+        ("GET /expenses/<id>", lambda i: ("GET", f"/expenses/{by_id(i)}", None, None)),
+        ("POST /expenses", lambda i: ("POST", "/expenses", expense_body(i), None)),
+        ("POST /expenses/bulk (100 rows)", lambda i: (
+            "POST", "/expenses/bulk", [expense_body(i * 100 + row) for row in range(100)], None)),
+        ("PUT /expenses/<id>", lambda i: ("PUT", f"/expenses/{by_id(i)}", {"amount": i + 0.5}, None)),
+        ("DELETE /expenses/<id>", lambda i: ("DELETE", f"/expenses/{delete_ids[i]}", None, None))
+    ]
+
+    results = {}
+    try:
+        for name, make_request in endpoints:
+            log(f"  {name}")
+            results[name] = run_endpoint(port, make_request, args.requests, args.concurrency)
+    finally:
+        server.shutdown()
+    return results
+
+
+def seed_users(module, app, count):
+    hashed_password = bcrypt.hashpw(PASSWORD.encode("utf-8"), bcrypt.gensalt(rounds=module.BCRYPT_ROUNDS))
+    with app.app_context():
+        admin = {"username": "bench-admin", "password": hashed_password, "role": "admin"}
+        module.users_collection.insert_one(admin)
+        users = [{"username": f"bench-user-{i}", "password": hashed_password, "role": "user"} for i in range(count)]
+        if users:
+            module.users_collection.insert_many(users)
+        return admin, users
+
+
+def bench_user_service(args, log):
+    module = load_service("user-service", "user_service_app")
+    app = module.create_app({"MONGO_URI": "mongodb://localhost"})
+    log(f"Seeding {args.users} users...")
+    admin, users = seed_users(module, app, max(args.users, 1))
+    with app.app_context():
+        admin_headers = {"Authorization": f"Bearer {module.issue_token(admin)}"}
+        logout_tokens = [module.issue_token(users[i % len(users)]) for i in range(args.requests)]
+        doomed = [{"username": f"bench-doomed-{i}", "password": b"", "role": "user"} for i in range(args.requests)]
+        module.users_collection.insert_many(doomed)
+    server = start_server(app)
+    port = server.server_port
+
+    def credentials(username):
+        return {"username": username, "password": PASSWORD}
+
+    def user(i):
+        return users[i % len(users)]
+
+    endpoints = [
+        ("GET /ready", lambda i: ("GET", "/ready", None, None)),
+        ("POST /register", lambda i: ("POST", "/register", credentials(f"bench-new-{i}"), None)),
+        ("POST /login", lambda i: ("POST", "/login", credentials(user(i)["username"]), None)),
+        ("POST /admin/register", lambda i: ("POST", "/admin/register", credentials(f"bench-new-admin-{i}"), None)),
+        ("POST /admin/login", lambda i: ("POST", "/admin/login", credentials("bench-admin"), None)),
+        ("GET /admin/users (100 per page)", lambda i: ("GET", "/admin/users?limit=100", None, admin_headers)),
+        ("POST /admin/user", lambda i: ("POST", "/admin/user", credentials(f"bench-created-{i}"), admin_headers)),
+        ("GET /admin/user/<id>", lambda i: ("GET", f"/admin/user/{user(i)['_id']}", None, admin_headers)),
+        ("PUT /admin/user/<id>", lambda i: (
+            "PUT", f"/admin/user/{user(i)['_id']}", {"password": PASSWORD}, admin_headers)),
+        ("DELETE /admin/user/<id>", lambda i: ("DELETE", f"/admin/user/{doomed[i]['_id']}", None, admin_headers)),
+        ("POST /logout", lambda i: ("POST", "/logout", None, {"Authorization": f"Bearer {logout_tokens[i]}"}))
+    ]
+
+    results = {}
+    try:
+        for name, make_request in endpoints:
+            log(f"  {name}")
+            results[name] = run_endpoint(port, make_request, args.requests, args.concurrency)
+    finally:
+        server.shutdown()
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_table(results):
+    for service, endpoints in results.items():
+        print(f"\n{service}")
+        print(f"  {'route':<42} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+        for name, stats in endpoints.items():
+            latency = stats["latency_ms"]
+            print(f"  {name:<42} {stats['throughput_rps']:>9} {latency['p50']:>9} "
+                  f"{latency['p95']:>9} {latency['p99']:>9} {stats['errors']:>7}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--expenses", type=int, default=10000, help="expenses to seed (default 10000)")
+    parser.add_argument("--users", type=int, default=100, help="users to seed (default 100)")
+    parser.add_argument("--requests", type=int, default=200, help="requests per route (default 200)")
+    parser.add_argument("--concurrency", type=int, default=8, help="concurrent clients (default 8)")
+    parser.add_argument("--bcrypt-rounds", type=int, default=12, help="bcrypt cost used by user-service (default 12)")
+    parser.add_argument("--service", choices=["expense-service", "user-service"], action="append",
+                        help="only benchmark this service (can be repeated)")
+    parser.add_argument("--output", default="bench-results.json", help="where to write the JSON results")
+    args = parser.parse_args()
+
+    # Settings read by the services when they are imported
+    os.environ["BCRYPT_ROUNDS"] = str(args.bcrypt_rounds)
+    os.environ.setdefault("JWT_SECRET", "benchmark-secret")
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+
+    def log(message):
+        print(message, file=sys.stderr, flush=True)
+
+    services = args.service or ["expense-service", "user-service"]
+    results = {}
+    if "expense-service" in services:
+        log("expense-service")
+        results["expense-service"] = bench_expense_service(args, log)
+    if "user-service" in services:
+        log("user-service")
+        results["user-service"] = bench_user_service(args, log)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "parameters": vars(args)
+        },
+        "results": results
+    }
+    with open(args.output, "w") as output:
+        json.dump(report, output, indent=2)
+
+    print_table(results)
+    print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,62 +1,811 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Blueprint, Response, request, jsonify, make_response, current_app
 from flask_cors import CORS  # Import CORS
-from pymongo import MongoClient
+from pymongo import MongoClient, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
+import atexit
+import base64
+import csv
+import hashlib
+import io
+import json
+import math
 import os
+import threading
+import time as clock
+import zlib
+from collections import OrderedDict
+from datetime import datetime, time, timedelta, timezone
+from functools import wraps
 from dotenv import load_dotenv
 from bson import ObjectId
+from werkzeug.local import LocalProxy
+from metrics import init_metrics, record_write_batch
 
 # Load environment variables
 load_dotenv()
 
-app = Flask(__name__)
+# Routes and commands are registered on this blueprint; create_app() builds the Flask app
+bp = Blueprint("expenses", __name__, cli_group=None)
 
-# Enable CORS for the whole app
-CORS(app, origins="http://localhost:5173")  # Allow React frontend running at localhost:3000
+# MongoDB connection settings, read from .env. Each worker process gets its own pool of up to MONGO_MAX_POOL_SIZE connections.
+MONGO_CONFIG = {
+    "MONGO_URI": os.getenv("MONGO_URI"),
+    "MONGO_MAX_POOL_SIZE": int(os.getenv("MONGO_MAX_POOL_SIZE", "100")),
+    "MONGO_MIN_POOL_SIZE": int(os.getenv("MONGO_MIN_POOL_SIZE", "0")),
+    # How long a request waits for a free pooled connection before failing
+    "MONGO_WAIT_QUEUE_TIMEOUT_MS": int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "2000")),
+    # How long to wait for a reachable MongoDB server before failing
+    "MONGO_SERVER_SELECTION_TIMEOUT_MS": int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000")),
+    # Create indexes when the app is created (set to false to skip that work at startup)
+    "MONGO_CREATE_INDEXES": os.getenv("MONGO_CREATE_INDEXES", "true").lower() == "true"
+}
 
-# Connect to MongoDB using the URI from .env file
-client = MongoClient(os.getenv("MONGO_URI"))
-db = client.expense_manager  # Database name
-expenses_collection = db.expenses  # Collection name
+# Helper function to turn the MONGO_* settings into MongoClient / AsyncMongoClient options
+def mongo_client_options(config):
+    return {
+        "maxPoolSize": config["MONGO_MAX_POOL_SIZE"],
+        "minPoolSize": config["MONGO_MIN_POOL_SIZE"],
+        "waitQueueTimeoutMS": config["MONGO_WAIT_QUEUE_TIMEOUT_MS"],
+        "serverSelectionTimeoutMS": config["MONGO_SERVER_SELECTION_TIMEOUT_MS"]
+    }
+
+mongo_client_lock = threading.Lock()
+
+# Helper function to get the app's MongoDB client.
+# The client is created on first use in each process, so workers forked by gunicorn never share one.
+def get_client():
+    app = current_app._get_current_object()
+    pid, client = app.extensions.get("mongo_client", (None, None))
+    if pid != os.getpid():
+        with mongo_client_lock:
+            pid, client = app.extensions.get("mongo_client", (None, None))
+            if pid != os.getpid():
+                client = MongoClient(app.config["MONGO_URI"], **mongo_client_options(app.config))
+                app.extensions["mongo_client"] = (os.getpid(), client)
+    return client
+
+# Helper function to close the app's MongoDB client in this process (the next get_client() opens a new one)
+def close_client():
+    app = current_app._get_current_object()
+    with mongo_client_lock:
+        pid, client = app.extensions.pop("mongo_client", (None, None))
+    if client is not None and pid == os.getpid():
+        client.close()
+
+# Helper function to get the database
+def get_db():
+    return get_client().expense_manager  # Database name
+
+expenses_collection = LocalProxy(lambda: get_db().expenses)  # Collection name
+rollups_collection = LocalProxy(lambda: get_db().expense_rollups)  # Spending totals per category and month
+cache_versions_collection = LocalProxy(lambda: get_db().cache_versions)  # Shared cache version counters (see SHARED_CACHE_VERSION)
+
+# Indexes used by the list filters and sort orders
+EXPENSE_INDEXES = [
+    [("category", 1), ("date", 1), ("_id", 1)],
+    [("date", 1), ("_id", 1)]
+]
+
+# Create the indexes (create_index is a no-op if they exist)
+def ensure_indexes():
+    for keys in EXPENSE_INDEXES:
+        expenses_collection.create_index(keys)
+
+# Helper function to parse a date (e.g. "2024-11-24" or "2024-11-24T18:30:00Z") into a datetime
+def parse_date(value):
+    if isinstance(value, datetime):
+        date = value
+    elif isinstance(value, str):
+        try:
+            date = datetime.fromisoformat(value.strip())
+        except ValueError:
+            raise ValueError(f"Invalid date: {value}")
+    else:
+        raise ValueError(f"Invalid date: {value}")
+
+    # MongoDB stores naive UTC datetimes
+    if date.tzinfo is not None:
+        date = date.astimezone(timezone.utc).replace(tzinfo=None)
+    return date
+
+# Helper function to parse an amount into a number
+def parse_amount(value):
+    if isinstance(value, bool):
+        raise ValueError(f"Invalid amount: {value}")
+    try:
+        amount = float(value)
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError(f"Invalid amount: {value}")
+    # NaN and infinity would poison the rollup totals and can't be sent back as JSON
+    if not math.isfinite(amount):
+        raise ValueError(f"Invalid amount: {value}")
+    return amount
+
+# Helper function to convert an expense document into JSON-friendly values
+def serialize_expense(expense):
+    expense["_id"] = str(expense["_id"])  # Convert ObjectId to string
+    date = expense.get("date")
+    if isinstance(date, datetime):
+        # Dates without a time of day go back out the way they came in, e.g. "2024-11-24"
+        expense["date"] = date.date().isoformat() if date.time() == time() else date.isoformat()
+    return expense
+
+# Helper function to get the "YYYY-MM" month an expense belongs to
+def expense_month(date):
+    return str(date)[:7]
+
+# Helper function to get the amount counted in rollups (non-numeric amounts count as 0, like $sum)
+def rollup_amount(amount):
+    if isinstance(amount, (int, float)) and not isinstance(amount, bool):
+        return amount
+    return 0
+
+# Helper function to build the rollup update that adds (sign=1) or removes (sign=-1) an expense
+def rollup_change(expense, sign):
+    return UpdateOne(
+        {"_id": {"category": expense["category"], "month": expense_month(expense["date"])}},
+        {"$inc": {"total": sign * rollup_amount(expense["amount"]), "count": sign}},
+        upsert=True
+    )
+
+# Helper function to build the rollup updates for many new expenses, folded into one $inc per rollup
+def rollup_changes_for(expenses):
+    deltas = {}
+    for expense in expenses:
+        key = (expense["category"], expense_month(expense["date"]))
+        total, count = deltas.get(key, (0, 0))
+        deltas[key] = (total + rollup_amount(expense["amount"]), count + 1)
+    return [
+        UpdateOne(
+            {"_id": {"category": category, "month": month}},
+            {"$inc": {"total": total, "count": count}},
+            upsert=True
+        )
+        for (category, month), (total, count) in deltas.items()
+    ]
+
+# Helper function to add (sign=1) or remove (sign=-1) an expense from the rollups
+def apply_rollup(expense, sign):
+    rollups_collection.bulk_write([rollup_change(expense, sign)])
+
+# Pipeline that recomputes every rollup from the expenses collection
+ROLLUP_PIPELINE = [
+    {"$group": {
+        "_id": {"category": "$category", "month": {"$substr": [{"$toString": "$date"}, 0, 7]}},
+        "total": {"$sum": "$amount"},
+        "count": {"$sum": 1}
+    }},
+    {"$out": "expense_rollups"}
+]
+
+# Command to rebuild the rollups from scratch: flask --app app rebuild-rollups
+@bp.cli.command("rebuild-rollups")
+def rebuild_rollups():
+    expenses_collection.aggregate(ROLLUP_PIPELINE)
+    invalidate_cache()
+    print(f"Rebuilt {rollups_collection.count_documents({})} rollups")
+
+# Response cache settings for the GET routes
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "1024"))
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "30"))
+# With several worker processes, keep the cache version in MongoDB so a write in one worker invalidates all of them
+SHARED_CACHE_VERSION = os.getenv("SHARED_CACHE_VERSION", "false").lower() == "true"
+
+response_cache = OrderedDict()  # request path -> (version, expires at, body, etag)
+cache_lock = threading.Lock()
+local_cache_version = 0
+
+# Helper function to get the version cached responses must match to be served
+def current_cache_version():
+    if SHARED_CACHE_VERSION:
+        counter = cache_versions_collection.find_one({"_id": expenses_collection.name})
+        return counter["version"] if counter else 0
+    return local_cache_version
+
+# Helper function to drop every cached response after expenses change
+def invalidate_cache():
+    global local_cache_version
+    with cache_lock:
+        local_cache_version += 1
+        response_cache.clear()
+    if SHARED_CACHE_VERSION:
+        cache_versions_collection.update_one({"_id": expenses_collection.name}, {"$inc": {"version": 1}}, upsert=True)
+
+# Decorator that serves a route from the response cache and answers If-None-Match with 304
+def cached_response(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.full_path
+        # Read the version before querying, so a write that happens meanwhile makes this entry stale
+        version = current_cache_version()
+
+        with cache_lock:
+            entry = response_cache.get(key)
+            if entry and entry[0] == version and entry[1] > clock.monotonic():
+                response_cache.move_to_end(key)
+            else:
+                entry = None
+
+        if entry:
+            response = current_app.response_class(entry[2], mimetype="application/json")
+            etag = entry[3]
+        else:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+            body = response.get_data()
+            etag = hashlib.sha1(body).hexdigest()
+            with cache_lock:
+                response_cache[key] = (version, clock.monotonic() + RESPONSE_CACHE_TTL_SECONDS, body, etag)
+                response_cache.move_to_end(key)
+                if len(response_cache) > RESPONSE_CACHE_SIZE:
+                    response_cache.popitem(last=False)
+
+        response.set_etag(etag)
+        # Let browsers keep the response but check the ETag before using it
+        response.headers["Cache-Control"] = "no-cache"
+        return response.make_conditional(request)
+    return wrapper
 
 # Route to check if the service is working
-@app.route('/', methods=['GET'])
+@bp.route('/', methods=['GET'])
 def health_check():
     return jsonify({"message": "Expenses service is working"}), 200
 
+# Route to check if the service can reach MongoDB (also opens the first pooled connection)
+@bp.route('/ready', methods=['GET'])
+def readiness_check():
+    try:
+        get_client().admin.command("ping")
+        return jsonify({"message": "Expenses service is ready"}), 200
+    except Exception as e:
+        return jsonify({"error": f"MongoDB is not reachable: {str(e)}"}), 503
+
+# Helper function to build an expense document from request data
+def build_expense(data):
+    # Check if all required fields are provided
+    if not isinstance(data, dict) or not all(field in data for field in ["description", "amount", "category", "date"]):
+        raise ValueError("Missing required fields")
+
+    return {
+        "description": data["description"],
+        "amount": parse_amount(data["amount"]),
+        "category": data["category"],
+        "date": parse_date(data["date"])
+    }
+
+# Helper function to build the $set for an expense update from request data
+def build_expense_update(data):
+    if not isinstance(data, dict):
+        data = {}
+    updated_expense = {
+        "description": data.get("description"),
+        "amount": data.get("amount"),
+        "category": data.get("category"),
+        "date": data.get("date")
+    }
+
+    updated_expense = {key: value for key, value in updated_expense.items() if value is not None}
+
+    if not updated_expense:
+        raise ValueError("No fields provided to update")
+
+    if "amount" in updated_expense:
+        updated_expense["amount"] = parse_amount(updated_expense["amount"])
+    if "date" in updated_expense:
+        updated_expense["date"] = parse_date(updated_expense["date"])
+    return updated_expense
+
+# Write batching for POST /expenses (off by default). With WRITE_BATCHING=true, expenses posted at the same time are
+# collected for up to WRITE_BATCH_WINDOW_MS, or until WRITE_BATCH_MAX_SIZE are waiting, and written with one insert_many.
+WRITE_BATCHING = os.getenv("WRITE_BATCHING", "false").lower() == "true"
+WRITE_BATCH_WINDOW_MS = float(os.getenv("WRITE_BATCH_WINDOW_MS", "5"))
+WRITE_BATCH_MAX_SIZE = int(os.getenv("WRITE_BATCH_MAX_SIZE", "100"))
+
+# Expenses waiting to be inserted together. The request that opens a batch waits for the window and writes it for everyone.
+class InsertBatch:
+    def __init__(self, collection):
+        self.collection = collection
+        self.expenses = []
+        self.results = []  # inserted id, or the exception to raise, for each expense
+        self.opened_at = clock.perf_counter()
+        self.written_at = None
+        self.full = threading.Event()
+        self.done = threading.Event()
+
+insert_batch_lock = threading.Lock()
+open_insert_batch = None
+flushing_inserts = False  # set on shutdown, so batches are written without waiting for the window
+
+# Helper function to write a batch of expenses and set the result of each one
+def write_insert_batch(batch):
+    batch.written_at = clock.perf_counter()
+    # Everything runs inside the try: the other requests in the batch wait on batch.done
+    try:
+        record_write_batch(len(batch.expenses), batch.written_at - batch.opened_at)
+        failed = {}
+        try:
+            batch.collection.insert_many(batch.expenses, ordered=False)
+        except BulkWriteError as e:
+            for error in e.details.get("writeErrors", []):
+                failed[error["index"]] = Exception(error.get("errmsg", "Write error"))
+
+        inserted = [expense for index, expense in enumerate(batch.expenses) if index not in failed]
+        changes = rollup_changes_for(inserted)
+        if changes:
+            rollups_collection.bulk_write(changes, ordered=False)
+        if inserted:
+            invalidate_cache()
+        batch.results = [failed.get(index, expense.get("_id")) for index, expense in enumerate(batch.expenses)]
+    except Exception as e:
+        batch.results = [e] * len(batch.expenses)
+    finally:
+        batch.done.set()
+
+# Helper function to insert an expense, together with any other expenses posted at the same time if WRITE_BATCHING is on.
+# Returns the inserted id and the time spent waiting for the batch to be written.
+def insert_expense(expense):
+    global open_insert_batch
+    if not WRITE_BATCHING:
+        result = expenses_collection.insert_one(expense)
+        apply_rollup(expense, 1)
+        invalidate_cache()
+        return result.inserted_id, 0
+
+    collection = expenses_collection._get_current_object()
+    queued_at = clock.perf_counter()
+    with insert_batch_lock:
+        batch = open_insert_batch
+        # Compare with != : pymongo builds a new Collection object on every lookup
+        opens_batch = batch is None or batch.collection != collection
+        if opens_batch:
+            batch = InsertBatch(collection)
+            open_insert_batch = batch
+        index = len(batch.expenses)
+        batch.expenses.append(expense)
+        if len(batch.expenses) >= WRITE_BATCH_MAX_SIZE:
+            open_insert_batch = None
+            batch.full.set()
+
+    if opens_batch:
+        if not flushing_inserts:
+            batch.full.wait(WRITE_BATCH_WINDOW_MS / 1000)
+        # Close the batch before writing it; later requests start a new one
+        with insert_batch_lock:
+            if open_insert_batch is batch:
+                open_insert_batch = None
+        write_insert_batch(batch)
+    else:
+        batch.done.wait()
+
+    result = batch.results[index]
+    if isinstance(result, Exception):
+        raise result
+    return result, batch.written_at - queued_at
+
+# Write the open batch now instead of at the end of its window (called on shutdown)
+def flush_inserts():
+    global flushing_inserts
+    with insert_batch_lock:
+        flushing_inserts = True
+        if open_insert_batch is not None:
+            open_insert_batch.full.set()
+
+atexit.register(flush_inserts)
+
 # Route to create a new expense
-@app.route('/expenses', methods=['POST'])
+@bp.route('/expenses', methods=['POST'])
 def add_expense():
     try:
-        data = request.json
-        
-        # Check if all required fields are provided
-        if not all(field in data for field in ["description", "amount", "category", "date"]):
-            return jsonify({"error": "Missing required fields"}), 400
-
-        expense = {
-            "description": data["description"],
-            "amount": data["amount"],
-            "category": data["category"],
-            "date": data["date"]
-        }
-        result = expenses_collection.insert_one(expense)
-        return jsonify({"message": "Expense added", "id": str(result.inserted_id)}), 201
+        try:
+            expense = build_expense(request.json)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        inserted_id, batch_wait = insert_expense(expense)
+        response = jsonify({"message": "Expense added", "id": str(inserted_id)})
+        if WRITE_BATCHING:
+            response.headers["Server-Timing"] = f"batch-wait;dur={batch_wait * 1000:.1f}"
+        return response, 201
     except Exception as e:
         return jsonify({"error": f"Error adding expense: {str(e)}"}), 400
 
-# Route to get all expenses
-@app.route('/expenses', methods=['GET'])
+# Bulk import settings
+BULK_CHUNK_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000
+
+# Helper function to read NDJSON rows from the request body one line at a time
+def iter_ndjson_rows(stream):
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield None
+
+# Helper function to read CSV rows (with a header line) from the request body one line at a time
+def iter_csv_rows(stream):
+    for row in csv.DictReader(stream):
+        # Short rows leave missing columns as None; treat them as not provided
+        yield {key: value for key, value in row.items() if key is not None and value is not None}
+
+# Helper function to iterate over rows until the body ends or can no longer be read (bad encoding or CSV,
+# client disconnected); the error that stopped it is kept in stopped["error"]
+def iter_until_error(rows, stopped):
+    try:
+        yield from rows
+    except Exception as e:
+        stopped["error"] = e
+
+# Helper function to insert one chunk of expenses; returns the number inserted and the per-row errors
+def insert_expense_chunk(chunk, rows):
+    failed = {}
+    try:
+        expenses_collection.insert_many(chunk, ordered=False)
+    except BulkWriteError as e:
+        for error in e.details.get("writeErrors", []):
+            failed[error["index"]] = error.get("errmsg", "Write error")
+
+    changes = rollup_changes_for(expense for index, expense in enumerate(chunk) if index not in failed)
+    if changes:
+        rollups_collection.bulk_write(changes, ordered=False)
+
+    errors = [{"row": rows[index], "error": message} for index, message in failed.items()]
+    return len(chunk) - len(failed), errors
+
+# Route to create many expenses at once (JSON array, NDJSON or CSV body)
+@bp.route('/expenses/bulk', methods=['POST'])
+def add_expenses_bulk():
+    inserted = 0
+    try:
+        content_type = request.mimetype
+        if content_type in ("application/x-ndjson", "application/jsonl"):
+            rows = iter_ndjson_rows(io.TextIOWrapper(request.stream, encoding="utf-8"))
+        elif content_type == "text/csv":
+            rows = iter_csv_rows(io.TextIOWrapper(request.stream, encoding="utf-8", newline=""))
+        else:
+            data = request.json
+            if isinstance(data, dict):
+                data = data.get("expenses")
+            if not isinstance(data, list):
+                return jsonify({"error": "Expected a list of expenses"}), 400
+            rows = iter(data)
+
+        error_count = 0
+        errors = []
+        chunk = []
+        chunk_rows = []
+
+        def record(new_errors):
+            nonlocal error_count
+            error_count += len(new_errors)
+            errors.extend(new_errors[:MAX_REPORTED_ERRORS - len(errors)])
+
+        # The error that ended the import early is always reported, after the row errors before it
+        def record_stop(row_number, message):
+            nonlocal error_count
+            error_count += 1
+            errors.append({"row": row_number, "error": message})
+
+        stopped = {}
+        row_number = -1
+        try:
+            for row_number, row in enumerate(iter_until_error(rows, stopped)):
+                try:
+                    expense = build_expense(row)
+                except ValueError as e:
+                    record([{"row": row_number, "error": str(e) if row is not None else "Invalid JSON"}])
+                    continue
+
+                chunk.append(expense)
+                chunk_rows.append(row_number)
+                if len(chunk) == BULK_CHUNK_SIZE:
+                    chunk_inserted, chunk_errors = insert_expense_chunk(chunk, chunk_rows)
+                    inserted += chunk_inserted
+                    record(chunk_errors)
+                    chunk = []
+                    chunk_rows = []
+
+            if chunk:
+                chunk_inserted, chunk_errors = insert_expense_chunk(chunk, chunk_rows)
+                inserted += chunk_inserted
+                record(chunk_errors)
+        except Exception as e:
+            # Writing failed: the chunk being written and everything after it was not imported
+            record_stop(chunk_rows[0] if chunk_rows else row_number + 1, f"Import stopped: {str(e)}")
+        if "error" in stopped:
+            record_stop(row_number + 1, f"Import stopped, the body could not be read: {str(stopped['error'])}")
+
+        status = 201 if inserted else 400
+        return jsonify({"message": "Expenses imported", "inserted": inserted, "error_count": error_count, "errors": errors}), status
+    except Exception as e:
+        return jsonify({"error": f"Error importing expenses: {str(e)}"}), 400
+    finally:
+        # Chunks already written stay written, so clear cached responses even if the import failed partway
+        if inserted:
+            invalidate_cache()
+
+# Command to convert string dates and amounts stored by older versions: flask --app app migrate-expenses
+@bp.cli.command("migrate-expenses")
+def migrate_expenses():
+    converted = 0
+    skipped = 0
+    updates = []
+    legacy = {"$or": [{"date": {"$type": "string"}}, {"amount": {"$type": "string"}}]}
+    for expense in expenses_collection.find(legacy, {"date": 1, "amount": 1}):
+        try:
+            changes = {"date": parse_date(expense["date"]), "amount": parse_amount(expense["amount"])}
+        except (KeyError, ValueError):
+            skipped += 1
+            continue
+        updates.append(UpdateOne({"_id": expense["_id"]}, {"$set": changes}))
+        if len(updates) == BULK_CHUNK_SIZE:
+            converted += expenses_collection.bulk_write(updates, ordered=False).modified_count
+            updates = []
+    if updates:
+        converted += expenses_collection.bulk_write(updates, ordered=False).modified_count
+
+    # String amounts were counted as 0, so the rollups need recomputing
+    expenses_collection.aggregate(ROLLUP_PIPELINE)
+    invalidate_cache()
+    print(f"Converted {converted} expenses, skipped {skipped} with invalid values")
+
+# Pagination settings for listing expenses
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+EXPENSE_FIELDS = ["description", "amount", "category", "date"]
+
+# Helper function to build a projection from the "fields" query parameter
+def build_projection(fields_param):
+    if not fields_param:
+        return None
+    fields = [field.strip() for field in fields_param.split(",") if field.strip()]
+    unknown = [field for field in fields if field not in EXPENSE_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return {field: 1 for field in fields}
+
+# Sort orders accepted by the "sort" query parameter
+SORT_ORDERS = {
+    "_id": ("_id", 1),
+    "-_id": ("_id", -1),
+    "date": ("date", 1),
+    "-date": ("date", -1)
+}
+
+# Helper function to build a query from the "from", "to" and "category" query parameters
+def build_expense_filter(args):
+    query = {}
+    date_range = {}
+    if args.get("from"):
+        date_range["$gte"] = parse_date(args["from"])
+    if args.get("to"):
+        to_date = parse_date(args["to"])
+        # A plain day ("2024-11-30") includes everything on that day
+        if len(args["to"].strip()) == 10:
+            date_range["$lt"] = to_date + timedelta(days=1)
+        else:
+            date_range["$lte"] = to_date
+    if date_range:
+        query["date"] = date_range
+    if args.get("category"):
+        query["category"] = args["category"]
+    return query
+
+# Helper function to make an opaque cursor pointing at the last expense of a page
+def encode_cursor(expense, sort_field):
+    position = {"id": str(expense["_id"])}
+    if sort_field == "date":
+        position["date"] = expense["date"].isoformat()
+    return base64.urlsafe_b64encode(json.dumps(position).encode("utf-8")).decode("ascii")
+
+# Helper function to turn a cursor back into a query for the expenses after it
+def decode_cursor(token, sort_field, direction):
+    try:
+        position = json.loads(base64.urlsafe_b64decode(token.encode("ascii")))
+        last_id = ObjectId(position["id"])
+        operator = "$gt" if direction == 1 else "$lt"
+        if sort_field == "_id":
+            return {"_id": {operator: last_id}}
+        last_date = datetime.fromisoformat(position["date"])
+    except (ValueError, TypeError, KeyError):
+        raise ValueError("Invalid cursor")
+    return {"$or": [
+        {"date": {operator: last_date}},
+        {"date": last_date, "_id": {operator: last_id}}
+    ]}
+
+# Helper function to turn the GET /expenses query parameters into a page query
+def build_page_query(args):
+    limit = args.get("limit", DEFAULT_PAGE_SIZE, type=int)
+    if limit < 1 or limit > MAX_PAGE_SIZE:
+        raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+
+    sort = args.get("sort", "_id")
+    if sort not in SORT_ORDERS:
+        raise ValueError(f"sort must be one of: {', '.join(SORT_ORDERS)}")
+    sort_field, direction = SORT_ORDERS[sort]
+
+    query = build_expense_filter(args)
+    after = args.get("after")
+    if after:
+        query.update(decode_cursor(after, sort_field, direction))
+    projection = build_projection(args.get("fields"))
+
+    # The cursor needs the sort field even when the client did not ask for it
+    hide_date = projection is not None and sort_field == "date" and "date" not in projection
+    if hide_date:
+        projection["date"] = 1
+
+    sort_keys = [(sort_field, direction)] if sort_field == "_id" else [(sort_field, direction), ("_id", direction)]
+    return {
+        "query": query,
+        "projection": projection,
+        "sort": sort_keys,
+        "limit": limit,
+        "sort_field": sort_field,
+        "hide_date": hide_date
+    }
+
+# Helper function to build the GET /expenses response from up to limit + 1 documents
+def build_expense_page(documents, page_query):
+    expenses = []
+    next_cursor = None
+    last_expense = None
+    for expense in documents:
+        if len(expenses) == page_query["limit"]:
+            next_cursor = encode_cursor(last_expense, page_query["sort_field"])
+            break
+        last_expense = dict(expense)
+        if page_query["hide_date"]:
+            expense.pop("date", None)
+        expenses.append(serialize_expense(expense))
+    return {"expenses": expenses, "next_cursor": next_cursor}
+
+# Route to get expenses, one page at a time (keyset pagination on _id or date)
+@bp.route('/expenses', methods=['GET'])
+@cached_response
 def get_expenses():
     try:
-        expenses = list(expenses_collection.find())
-        for expense in expenses:
-            expense["_id"] = str(expense["_id"])  # Convert ObjectId to string
-        return jsonify(expenses), 200
+        try:
+            page_query = build_page_query(request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        # Fetch one extra document to know whether another page exists
+        cursor = expenses_collection.find(page_query["query"], page_query["projection"]) \
+            .sort(page_query["sort"]).limit(page_query["limit"] + 1)
+        return jsonify(build_expense_page(cursor, page_query)), 200
     except Exception as e:
         return jsonify({"error": f"Error retrieving expenses: {str(e)}"}), 400
 
+# Sort order of the rollups in GET /expenses/summary
+SUMMARY_SORT = [("_id.month", 1), ("_id.category", 1)]
+
+# Helper function to build a rollups query from the "from", "to" and "category" query parameters
+def build_summary_query(args):
+    query = {"count": {"$gt": 0}}
+    month_range = {}
+    if args.get("from"):
+        month_range["$gte"] = args["from"][:7]
+    if args.get("to"):
+        month_range["$lte"] = args["to"][:7]
+    if month_range:
+        query["_id.month"] = month_range
+    if args.get("category"):
+        query["_id.category"] = args["category"]
+    return query
+
+# Helper function to build the GET /expenses/summary response from rollup documents
+def build_summary(rollup_documents):
+    rollups = []
+    by_category = {}
+    by_month = {}
+    for rollup in rollup_documents:
+        category = rollup["_id"]["category"]
+        month = rollup["_id"]["month"]
+        rollups.append({"category": category, "month": month, "total": rollup["total"], "count": rollup["count"]})
+        by_category[category] = by_category.get(category, 0) + rollup["total"]
+        by_month[month] = by_month.get(month, 0) + rollup["total"]
+
+    return {
+        "rollups": rollups,
+        "by_category": by_category,
+        "by_month": by_month,
+        "total": sum(by_category.values())
+    }
+
+# Route to get spending totals per category and month
+@bp.route('/expenses/summary', methods=['GET'])
+@cached_response
+def get_expense_summary():
+    try:
+        rollups = rollups_collection.find(build_summary_query(request.args)).sort(SUMMARY_SORT)
+        return jsonify(build_summary(rollups)), 200
+    except Exception as e:
+        return jsonify({"error": f"Error retrieving summary: {str(e)}"}), 400
+
+# Export settings: documents fetched from MongoDB per batch, and rows per chunk written to the response
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson"
+}
+EXPORT_COLUMNS = ["_id"] + EXPENSE_FIELDS
+# Export order: the (category, date, _id) and (date, _id) indexes serve both the filters and this sort,
+# so MongoDB never has to sort the whole export in memory
+EXPORT_SORT = [("date", 1), ("_id", 1)]
+
+# Helper function to build the export query and format from the "format", "from", "to" and "category" query parameters
+def build_export_query(args):
+    export_format = args.get("format", "csv")
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"format must be one of: {', '.join(EXPORT_FORMATS)}")
+    return build_expense_filter(args), export_format
+
+# Helper function to turn one expense into a line of the export
+def format_export_row(expense, export_format):
+    expense = serialize_expense(expense)
+    if export_format == "ndjson":
+        return json.dumps(expense) + "\n"
+    line = io.StringIO()
+    csv.writer(line).writerow([expense.get(column, "") for column in EXPORT_COLUMNS])
+    return line.getvalue()
+
+# Helper function to get the first line of an export (the CSV header; NDJSON has none)
+def export_header(export_format):
+    return ",".join(EXPORT_COLUMNS) + "\r\n" if export_format == "csv" else ""
+
+# Helper function to stream an export from a MongoDB cursor, one chunk of EXPORT_BATCH_SIZE rows at a time
+def iter_export(cursor, export_format):
+    try:
+        chunk = [export_header(export_format)]
+        for expense in cursor:
+            chunk.append(format_export_row(expense, export_format))
+            if len(chunk) >= EXPORT_BATCH_SIZE:
+                yield "".join(chunk).encode("utf-8")
+                chunk = []
+        if chunk:
+            yield "".join(chunk).encode("utf-8")
+    finally:
+        cursor.close()
+
+# Helper function to gzip a stream of chunks as they are produced
+def iter_gzip(chunks):
+    compressor = zlib.compressobj(wbits=31)  # 31 = gzip header and trailer
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+# Route to download every matching expense as CSV or NDJSON, streamed so memory use does not grow with the export
+@bp.route('/expenses/export', methods=['GET'])
+def export_expenses():
+    try:
+        try:
+            query, export_format = build_export_query(request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        cursor = expenses_collection.find(query).sort(EXPORT_SORT).batch_size(EXPORT_BATCH_SIZE)
+        body = iter_export(cursor, export_format)
+        response = Response(body, mimetype=EXPORT_FORMATS[export_format])
+        response.headers["Content-Disposition"] = f'attachment; filename="expenses.{export_format}"'
+        response.vary.add("Accept-Encoding")
+        # Compress on the fly if the client accepts gzip
+        if request.accept_encodings["gzip"]:
+            response.response = iter_gzip(body)
+            response.headers["Content-Encoding"] = "gzip"
+        return response
+    except Exception as e:
+        return jsonify({"error": f"Error exporting expenses: {str(e)}"}), 400
+
 # Route to get a single expense by ID
-@app.route('/expenses/<expense_id>', methods=['GET'])
+@bp.route('/expenses/<expense_id>', methods=['GET'])
+@cached_response
 def get_expense(expense_id):
     try:
         if not ObjectId.is_valid(expense_id):
@@ -64,34 +813,36 @@ def get_expense(expense_id):
 
         expense = expenses_collection.find_one({"_id": ObjectId(expense_id)})
         if expense:
-            expense["_id"] = str(expense["_id"])  # Convert ObjectId to string
-            return jsonify(expense), 200
+            return jsonify(serialize_expense(expense)), 200
         else:
             return jsonify({"error": "Expense not found"}), 404
     except Exception as e:
         return jsonify({"error": f"Error retrieving expense: {str(e)}"}), 400
 
 # Route to update an expense by ID
-@app.route('/expenses/<expense_id>', methods=['PUT'])
+@bp.route('/expenses/<expense_id>', methods=['PUT'])
 def update_expense(expense_id):
     try:
         if not ObjectId.is_valid(expense_id):
             return jsonify({"error": "Invalid expense ID format"}), 400
 
-        updated_expense = {
-            "description": request.json.get("description"),
-            "amount": request.json.get("amount"),
-            "category": request.json.get("category"),
-            "date": request.json.get("date")
-        }
-
-        updated_expense = {key: value for key, value in updated_expense.items() if value is not None}
+        try:
+            updated_expense = build_expense_update(request.json)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
 
-        if not updated_expense:
-            return jsonify({"error": "No fields provided to update"}), 400
-
-        result = expenses_collection.update_one({"_id": ObjectId(expense_id)}, {"$set": updated_expense})
-        if result.matched_count > 0:
+        # Get the previous version back so the rollups can be moved by the difference
+        previous = expenses_collection.find_one_and_update(
+            {"_id": ObjectId(expense_id)},
+            {"$set": updated_expense},
+            return_document=ReturnDocument.BEFORE
+        )
+        if previous:
+            rollups_collection.bulk_write([
+                rollup_change(previous, -1),
+                rollup_change({**previous, **updated_expense}, 1)
+            ])
+            invalidate_cache()
             return jsonify({"message": "Expense updated"}), 200
         else:
             return jsonify({"error": "Expense not found"}), 404
@@ -99,19 +850,43 @@ def update_expense(expense_id):
         return jsonify({"error": f"Error updating expense: {str(e)}"}), 400
 
 # Route to delete an expense by ID
-@app.route('/expenses/<expense_id>', methods=['DELETE'])
+@bp.route('/expenses/<expense_id>', methods=['DELETE'])
 def delete_expense(expense_id):
     try:
         if not ObjectId.is_valid(expense_id):
             return jsonify({"error": "Invalid expense ID format"}), 400
 
-        result = expenses_collection.delete_one({"_id": ObjectId(expense_id)})
-        if result.deleted_count > 0:
+        deleted = expenses_collection.find_one_and_delete({"_id": ObjectId(expense_id)})
+        if deleted:
+            apply_rollup(deleted, -1)
+            invalidate_cache()
             return jsonify({"message": "Expense deleted"}), 200
         else:
             return jsonify({"error": "Expense not found"}), 404
     except Exception as e:
         return jsonify({"error": f"Error deleting expense: {str(e)}"}), 400
 
+# Build the Flask app. Extra settings (e.g. MONGO_MAX_POOL_SIZE) can be passed in config.
+# Production entry point: gunicorn -c gunicorn.conf.py (see gunicorn.conf.py)
+def create_app(config=None):
+    app = Flask(__name__)
+    app.config.update(MONGO_CONFIG)
+    if config:
+        app.config.update(config)
+
+    # Enable CORS for the whole app
+    CORS(app, origins="http://localhost:5173")  # Allow React frontend running at localhost:3000
+
+    app.register_blueprint(bp)
+    init_metrics(app)
+
+    if app.config["MONGO_CREATE_INDEXES"]:
+        with app.app_context():
+            ensure_indexes()
+            # With gunicorn's preload_app this runs in the master process; don't keep its client (and its
+            # monitor threads and pooled connections) open there, each worker opens its own after the fork
+            close_client()
+    return app
+
 if __name__ == '__main__':
-    app.run(debug=False, host="localhost", port=5002)
+    create_app().run(debug=False, host="localhost", port=5002)
@@ -0,0 +1,427 @@
+from quart import Quart, Response, request, jsonify
+from quart_cors import cors
+from pymongo import AsyncMongoClient, ReturnDocument
+from pymongo.errors import BulkWriteError
+from bson import ObjectId
+import csv
+import json
+import zlib
+from dotenv import load_dotenv
+from metrics import init_async_metrics
+
+# Request parsing and response building are shared with the Flask app
+from app import (
+    BULK_CHUNK_SIZE,
+    EXPENSE_INDEXES,
+    EXPORT_BATCH_SIZE,
+    EXPORT_FORMATS,
+    EXPORT_SORT,
+    MAX_REPORTED_ERRORS,
+    MONGO_CONFIG,
+    SHARED_CACHE_VERSION,
+    SUMMARY_SORT,
+    build_expense,
+    build_expense_page,
+    build_expense_update,
+    build_export_query,
+    build_page_query,
+    build_summary,
+    build_summary_query,
+    export_header,
+    format_export_row,
+    mongo_client_options,
+    rollup_change,
+    rollup_changes_for,
+    serialize_expense
+)
+
+# Load environment variables
+load_dotenv()
+
+# Async version of the expenses service (same routes and responses as app.py), served with an ASGI server:
+# hypercorn asgi_app:app --bind localhost:5002
+app = Quart(__name__)
+
+# Bulk imports stream the body, so don't cap its size (Flask doesn't either)
+app.config["MAX_CONTENT_LENGTH"] = None
+
+# Enable CORS for the whole app
+app = cors(app, allow_origin="http://localhost:5173")
+
+# Request and MongoDB metrics on /metrics (only if METRICS_ENABLED)
+init_async_metrics(app)
+
+# MongoDB collections, set up once the server has started (in each worker process)
+client = None
+expenses_collection = None
+rollups_collection = None
+cache_versions_collection = None
+
+@app.before_serving
+async def connect_to_mongo():
+    global client, expenses_collection, rollups_collection, cache_versions_collection
+    client = AsyncMongoClient(MONGO_CONFIG["MONGO_URI"], **mongo_client_options(MONGO_CONFIG))
+    db = client.expense_manager  # Database name
+    expenses_collection = db.expenses
+    rollups_collection = db.expense_rollups
+    cache_versions_collection = db.cache_versions
+    if MONGO_CONFIG["MONGO_CREATE_INDEXES"]:
+        for keys in EXPENSE_INDEXES:
+            await expenses_collection.create_index(keys)
+
+@app.after_serving
+async def close_mongo():
+    await client.close()
+
+# Helper function to tell Flask workers sharing the cache version that expenses changed
+async def invalidate_cache():
+    if SHARED_CACHE_VERSION:
+        await cache_versions_collection.update_one({"_id": expenses_collection.name}, {"$inc": {"version": 1}}, upsert=True)
+
+# Route to check if the service is working
+@app.route('/', methods=['GET'])
+async def health_check():
+    return jsonify({"message": "Expenses service is working"}), 200
+
+# Route to check if the service can reach MongoDB (also opens the first pooled connection)
+@app.route('/ready', methods=['GET'])
+async def readiness_check():
+    try:
+        await client.admin.command("ping")
+        return jsonify({"message": "Expenses service is ready"}), 200
+    except Exception as e:
+        return jsonify({"error": f"MongoDB is not reachable: {str(e)}"}), 503
+
+# Route to create a new expense
+@app.route('/expenses', methods=['POST'])
+async def add_expense():
+    try:
+        try:
+            expense = build_expense(await request.get_json())
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        result = await expenses_collection.insert_one(expense)
+        await rollups_collection.bulk_write([rollup_change(expense, 1)])
+        await invalidate_cache()
+        return jsonify({"message": "Expense added", "id": str(result.inserted_id)}), 201
+    except Exception as e:
+        return jsonify({"error": f"Error adding expense: {str(e)}"}), 400
+
+# Helper function to read the request body one line at a time (keeping the line endings, like a file)
+async def aiter_lines(body):
+    buffer = b""
+    async for chunk in body:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line.decode("utf-8") + "\n"
+    if buffer:
+        yield buffer.decode("utf-8")
+
+# Helper function to read NDJSON rows from the request body one line at a time
+async def aiter_ndjson_rows(body):
+    async for line in aiter_lines(body):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield None
+
+# Helper function to check if a CSV line ends inside a quoted value (which then continues on the next line).
+# Follows the csv module: a quote only opens a quoted value at the start of a field, "" inside one is a quote,
+# and any other quote is part of the value.
+def ends_in_quoted_value(line, in_quotes):
+    at_field_start = not in_quotes
+    index = 0
+    while index < len(line):
+        char = line[index]
+        if in_quotes:
+            if char == '"':
+                if line[index + 1:index + 2] == '"':
+                    index += 1
+                else:
+                    in_quotes = False
+        elif char == ',':
+            at_field_start = True
+            index += 1
+            continue
+        elif char == '"' and at_field_start:
+            in_quotes = True
+        at_field_start = False
+        index += 1
+    return in_quotes
+
+# Helper function to read CSV rows (with a header line) from the request body one line at a time
+async def aiter_csv_rows(body):
+    header = None
+    record = ""
+    in_quotes = False
+
+    def parse(record):
+        nonlocal header
+        values = next(csv.reader([record]), [])
+        if not values:
+            return None
+        if header is None:
+            header = values
+            return None
+        # Like iter_csv_rows, extra values are dropped and missing columns are left out
+        return dict(zip(header, values))
+
+    async for line in aiter_lines(body):
+        record += line
+        # A quoted value can span lines; the record is complete once it is no longer inside one
+        in_quotes = ends_in_quoted_value(line, in_quotes)
+        if in_quotes:
+            continue
+        row = parse(record)
+        record = ""
+        if row is not None:
+            yield row
+
+    # Like csv.reader, a quoted value left open at the end of the body runs to the end
+    if record:
+        row = parse(record)
+        if row is not None:
+            yield row
+
+# Helper function to iterate over rows until the body ends or can no longer be read (bad encoding or CSV,
+# client disconnected); the error that stopped it is kept in stopped["error"]
+async def aiter_until_error(rows, stopped):
+    try:
+        async for row in rows:
+            yield row
+    except Exception as e:
+        stopped["error"] = e
+
+# Helper function to iterate over a JSON list the same way as a streamed body
+async def aiter_list(rows):
+    for row in rows:
+        yield row
+
+# Helper function to insert one chunk of expenses; returns the number inserted and the per-row errors
+async def insert_expense_chunk(chunk, rows):
+    failed = {}
+    try:
+        await expenses_collection.insert_many(chunk, ordered=False)
+    except BulkWriteError as e:
+        for error in e.details.get("writeErrors", []):
+            failed[error["index"]] = error.get("errmsg", "Write error")
+
+    changes = rollup_changes_for(expense for index, expense in enumerate(chunk) if index not in failed)
+    if changes:
+        await rollups_collection.bulk_write(changes, ordered=False)
+
+    errors = [{"row": rows[index], "error": message} for index, message in failed.items()]
+    return len(chunk) - len(failed), errors
+
+# Route to create many expenses at once (JSON array, NDJSON or CSV body)
+@app.route('/expenses/bulk', methods=['POST'])
+async def add_expenses_bulk():
+    inserted = 0
+    try:
+        content_type = request.mimetype
+        if content_type in ("application/x-ndjson", "application/jsonl"):
+            rows = aiter_ndjson_rows(request.body)
+        elif content_type == "text/csv":
+            rows = aiter_csv_rows(request.body)
+        else:
+            data = await request.get_json()
+            if isinstance(data, dict):
+                data = data.get("expenses")
+            if not isinstance(data, list):
+                return jsonify({"error": "Expected a list of expenses"}), 400
+            rows = aiter_list(data)
+
+        error_count = 0
+        errors = []
+        chunk = []
+        chunk_rows = []
+
+        def record(new_errors):
+            nonlocal error_count
+            error_count += len(new_errors)
+            errors.extend(new_errors[:MAX_REPORTED_ERRORS - len(errors)])
+
+        # The error that ended the import early is always reported, after the row errors before it
+        def record_stop(row_number, message):
+            nonlocal error_count
+            error_count += 1
+            errors.append({"row": row_number, "error": message})
+
+        stopped = {}
+        row_number = -1
+        try:
+            async for row in aiter_until_error(rows, stopped):
+                row_number += 1
+                try:
+                    expense = build_expense(row)
+                except ValueError as e:
+                    record([{"row": row_number, "error": str(e) if row is not None else "Invalid JSON"}])
+                    continue
+
+                chunk.append(expense)
+                chunk_rows.append(row_number)
+                if len(chunk) == BULK_CHUNK_SIZE:
+                    chunk_inserted, chunk_errors = await insert_expense_chunk(chunk, chunk_rows)
+                    inserted += chunk_inserted
+                    record(chunk_errors)
+                    chunk = []
+                    chunk_rows = []
+
+            if chunk:
+                chunk_inserted, chunk_errors = await insert_expense_chunk(chunk, chunk_rows)
+                inserted += chunk_inserted
+                record(chunk_errors)
+        except Exception as e:
+            # Writing failed: the chunk being written and everything after it was not imported
+            record_stop(chunk_rows[0] if chunk_rows else row_number + 1, f"Import stopped: {str(e)}")
+        if "error" in stopped:
+            record_stop(row_number + 1, f"Import stopped, the body could not be read: {str(stopped['error'])}")
+
+        status = 201 if inserted else 400
+        return jsonify({"message": "Expenses imported", "inserted": inserted, "error_count": error_count, "errors": errors}), status
+    except Exception as e:
+        return jsonify({"error": f"Error importing expenses: {str(e)}"}), 400
+    finally:
+        # Chunks already written stay written, so clear cached responses even if the import failed partway
+        if inserted:
+            await invalidate_cache()
+
+# Route to get expenses, one page at a time (keyset pagination on _id or date)
+@app.route('/expenses', methods=['GET'])
+async def get_expenses():
+    try:
+        try:
+            page_query = build_page_query(request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        # Fetch one extra document to know whether another page exists
+        cursor = expenses_collection.find(page_query["query"], page_query["projection"]) \
+            .sort(page_query["sort"]).limit(page_query["limit"] + 1)
+        return jsonify(build_expense_page(await cursor.to_list(), page_query)), 200
+    except Exception as e:
+        return jsonify({"error": f"Error retrieving expenses: {str(e)}"}), 400
+
+# Route to get spending totals per category and month
+@app.route('/expenses/summary', methods=['GET'])
+async def get_expense_summary():
+    try:
+        rollups = rollups_collection.find(build_summary_query(request.args)).sort(SUMMARY_SORT)
+        return jsonify(build_summary(await rollups.to_list())), 200
+    except Exception as e:
+        return jsonify({"error": f"Error retrieving summary: {str(e)}"}), 400
+
+# Helper function to stream an export from a MongoDB cursor, one chunk of EXPORT_BATCH_SIZE rows at a time
+async def aiter_export(cursor, export_format):
+    try:
+        chunk = [export_header(export_format)]
+        async for expense in cursor:
+            chunk.append(format_export_row(expense, export_format))
+            if len(chunk) >= EXPORT_BATCH_SIZE:
+                yield "".join(chunk).encode("utf-8")
+                chunk = []
+        if chunk:
+            yield "".join(chunk).encode("utf-8")
+    finally:
+        await cursor.close()
+
+# Helper function to gzip a stream of chunks as they are produced
+async def aiter_gzip(chunks):
+    compressor = zlib.compressobj(wbits=31)  # 31 = gzip header and trailer
+    async for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+# Route to download every matching expense as CSV or NDJSON, streamed so memory use does not grow with the export
+@app.route('/expenses/export', methods=['GET'])
+async def export_expenses():
+    try:
+        try:
+            query, export_format = build_export_query(request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        cursor = expenses_collection.find(query).sort(EXPORT_SORT).batch_size(EXPORT_BATCH_SIZE)
+        body = aiter_export(cursor, export_format)
+        # Compress on the fly if the client accepts gzip
+        gzipped = bool(request.accept_encodings["gzip"])
+        response = Response(aiter_gzip(body) if gzipped else body, mimetype=EXPORT_FORMATS[export_format])
+        response.headers["Content-Disposition"] = f'attachment; filename="expenses.{export_format}"'
+        response.vary.add("Accept-Encoding")
+        if gzipped:
+            response.headers["Content-Encoding"] = "gzip"
+        return response
+    except Exception as e:
+        return jsonify({"error": f"Error exporting expenses: {str(e)}"}), 400
+
+# Route to get a single expense by ID
+@app.route('/expenses/<expense_id>', methods=['GET'])
+async def get_expense(expense_id):
+    try:
+        if not ObjectId.is_valid(expense_id):
+            return jsonify({"error": "Invalid expense ID format"}), 400
+
+        expense = await expenses_collection.find_one({"_id": ObjectId(expense_id)})
+        if expense:
+            return jsonify(serialize_expense(expense)), 200
+        else:
+            return jsonify({"error": "Expense not found"}), 404
+    except Exception as e:
+        return jsonify({"error": f"Error retrieving expense: {str(e)}"}), 400
+
+# Route to update an expense by ID
+@app.route('/expenses/<expense_id>', methods=['PUT'])
+async def update_expense(expense_id):
+    try:
+        if not ObjectId.is_valid(expense_id):
+            return jsonify({"error": "Invalid expense ID format"}), 400
+
+        try:
+            updated_expense = build_expense_update(await request.get_json())
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        # Get the previous version back so the rollups can be moved by the difference
+        previous = await expenses_collection.find_one_and_update(
+            {"_id": ObjectId(expense_id)},
+            {"$set": updated_expense},
+            return_document=ReturnDocument.BEFORE
+        )
+        if previous:
+            await rollups_collection.bulk_write([
+                rollup_change(previous, -1),
+                rollup_change({**previous, **updated_expense}, 1)
+            ])
+            await invalidate_cache()
+            return jsonify({"message": "Expense updated"}), 200
+        else:
+            return jsonify({"error": "Expense not found"}), 404
+    except Exception as e:
+        return jsonify({"error": f"Error updating expense: {str(e)}"}), 400
+
+# Route to delete an expense by ID
+@app.route('/expenses/<expense_id>', methods=['DELETE'])
+async def delete_expense(expense_id):
+    try:
+        if not ObjectId.is_valid(expense_id):
+            return jsonify({"error": "Invalid expense ID format"}), 400
+
+        deleted = await expenses_collection.find_one_and_delete({"_id": ObjectId(expense_id)})
+        if deleted:
+            await rollups_collection.bulk_write([rollup_change(deleted, -1)])
+            await invalidate_cache()
+            return jsonify({"message": "Expense deleted"}), 200
+        else:
+            return jsonify({"error": "Expense not found"}), 404
+    except Exception as e:
+        return jsonify({"error": f"Error deleting expense: {str(e)}"}), 400
+
+if __name__ == '__main__':
+    app.run(debug=False, host="localhost", port=5002)
@@ -0,0 +1,50 @@
+# Gunicorn settings for running the service in production (Linux/macOS):
+# gunicorn -c gunicorn.conf.py
+import multiprocessing
+import os
+import sys
+from dotenv import load_dotenv
+
+# Read .env before the settings below (the app does the same when it is imported)
+load_dotenv()
+
+# create_app() is called once and the workers are forked from it.
+# Each worker opens its own MongoDB connection pool on first use, so preloading is fork-safe.
+wsgi_app = "app:create_app()"
+preload_app = True
+
+bind = os.getenv("BIND", "localhost:5002")
+workers = int(os.getenv("WEB_CONCURRENCY", str(multiprocessing.cpu_count() * 2 + 1)))
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "30"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+
+# Each worker keeps its own response cache. With more than one worker, a write handled by one of them must
+# invalidate the cached responses of all of them, so SHARED_CACHE_VERSION is on unless .env or the environment says otherwise.
+if workers > 1:
+    os.environ.setdefault("SHARED_CACHE_VERSION", "true")
+
+
+# Warn if several workers will serve cached responses without sharing the cache version
+# (SHARED_CACHE_VERSION=false, or more workers than configured above, e.g. with gunicorn -w)
+def when_ready(server):
+    app_module = sys.modules.get("app")
+    if server.cfg.workers > 1 and app_module is not None and not app_module.SHARED_CACHE_VERSION:
+        server.log.warning(
+            "SHARED_CACHE_VERSION is off with %d workers: cached GET /expenses responses can be stale for up to "
+            "RESPONSE_CACHE_TTL_SECONDS after a write handled by another worker. Set SHARED_CACHE_VERSION=true.",
+            server.cfg.workers
+        )
+
+
+# With PROMETHEUS_MULTIPROC_DIR set, drop the metrics of workers that have exited
+def child_exit(server, worker):
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
+
+
+# Write any batched expenses (WRITE_BATCHING) right away when a worker is interrupted
+def worker_int(worker):
+    from app import flush_inserts
+    flush_inserts()
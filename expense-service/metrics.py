@@ -0,0 +1,151 @@
+from flask import Response, request, g
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    ProcessCollector,
+    generate_latest,
+    multiprocess
+)
+from pymongo import monitoring
+import os
+import time
+
+# Metrics are only collected when METRICS_ENABLED=true; otherwise no hooks or listeners are installed.
+# With several gunicorn workers, also set PROMETHEUS_MULTIPROC_DIR to an empty directory so /metrics adds up all workers.
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "false").lower() == "true"
+
+SIZE_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000)
+
+# The service's own registry (instead of prometheus_client's global one)
+registry = CollectorRegistry()
+ProcessCollector(registry=registry)
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "Time spent handling a request", ["method", "route", "status"],
+    registry=registry
+)
+REQUEST_SIZE = Histogram(
+    "http_request_size_bytes", "Size of request bodies", ["method", "route"],
+    buckets=SIZE_BUCKETS, registry=registry
+)
+RESPONSE_SIZE = Histogram(
+    "http_response_size_bytes", "Size of response bodies", ["method", "route"],
+    buckets=SIZE_BUCKETS, registry=registry
+)
+REQUEST_ERRORS = Counter(
+    "http_request_errors_total", "Requests answered with a 4xx or 5xx status", ["method", "route", "status"],
+    registry=registry
+)
+MONGO_COMMAND_LATENCY = Histogram(
+    "mongodb_command_duration_seconds", "Time spent on MongoDB commands", ["command", "outcome"],
+    registry=registry
+)
+
+WRITE_BATCH_SIZE = Histogram(
+    "expense_write_batch_size", "Expenses written per batched insert_many (WRITE_BATCHING)",
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000), registry=registry
+)
+WRITE_BATCH_WAIT = Histogram(
+    "expense_write_batch_wait_seconds", "Time a write batch stayed open collecting expenses (WRITE_BATCHING)",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1), registry=registry
+)
+
+# Records the duration of every MongoDB command sent by any client created after it is registered
+class MongoCommandTimer(monitoring.CommandListener):
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        MONGO_COMMAND_LATENCY.labels(event.command_name, "succeeded").observe(event.duration_micros / 1e6)
+
+    def failed(self, event):
+        MONGO_COMMAND_LATENCY.labels(event.command_name, "failed").observe(event.duration_micros / 1e6)
+
+# Helper function to get the route label of a request (the URL rule, so IDs don't create new series)
+def route_label(req):
+    return req.url_rule.rule if req.url_rule else "unmatched"
+
+# Helper function to record a finished request (a Flask or Quart request and response)
+def observe_request(req, response, started):
+    method = req.method
+    route = route_label(req)
+    status = str(response.status_code)
+
+    REQUEST_LATENCY.labels(method, route, status).observe(time.perf_counter() - started)
+    REQUEST_SIZE.labels(method, route).observe(req.content_length or 0)
+    # Streamed responses have no known length
+    if response.content_length is not None:
+        RESPONSE_SIZE.labels(method, route).observe(response.content_length)
+    if response.status_code >= 400:
+        REQUEST_ERRORS.labels(method, route, status).inc()
+
+def start_timer():
+    g.metrics_started = time.perf_counter()
+
+def record_request(response):
+    if "metrics_started" in g:
+        observe_request(request, response, g.metrics_started)
+    return response
+
+# Helper function to get the metrics in the Prometheus text format
+def metrics_output():
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        # Add up the values written by every worker process
+        combined = CollectorRegistry()
+        multiprocess.MultiProcessCollector(combined)
+        return generate_latest(combined)
+    return generate_latest(registry)
+
+# Route to expose the metrics
+def metrics_endpoint():
+    return Response(metrics_output(), content_type=CONTENT_TYPE_LATEST)
+
+# Helper function to record one batched insert of expenses
+def record_write_batch(size, wait):
+    if METRICS_ENABLED:
+        WRITE_BATCH_SIZE.observe(size)
+        WRITE_BATCH_WAIT.observe(wait)
+
+mongo_listener_registered = False
+
+# Helper function to time the commands of every MongoDB client (MongoClient or AsyncMongoClient) created from now on
+def register_mongo_listener():
+    global mongo_listener_registered
+    if not mongo_listener_registered:
+        monitoring.register(MongoCommandTimer())
+        mongo_listener_registered = True
+
+# Install the request hooks, the MongoDB command listener and the /metrics route (only if METRICS_ENABLED)
+def init_metrics(app):
+    if not METRICS_ENABLED:
+        return
+
+    register_mongo_listener()
+    app.before_request(start_timer)
+    app.after_request(record_request)
+    app.add_url_rule("/metrics", "metrics", metrics_endpoint, methods=["GET"])
+
+# Same as init_metrics, for the Quart app in asgi_app.py. Call it before the app starts serving,
+# so the AsyncMongoClient created in before_serving picks up the command listener.
+def init_async_metrics(app):
+    if not METRICS_ENABLED:
+        return
+    from quart import Response as AsyncResponse, g as async_g, request as async_request
+
+    async def start_async_timer():
+        async_g.metrics_started = time.perf_counter()
+
+    async def record_async_request(response):
+        if "metrics_started" in async_g:
+            observe_request(async_request, response, async_g.metrics_started)
+        return response
+
+    async def async_metrics_endpoint():
+        return AsyncResponse(metrics_output(), content_type=CONTENT_TYPE_LATEST)
+
+    register_mongo_listener()
+    app.before_request(start_async_timer)
+    app.after_request(record_async_request)
+    app.add_url_rule("/metrics", "metrics", async_metrics_endpoint, methods=["GET"])
@@ -1,34 +1,312 @@
-from flask import Flask, request, jsonify, make_response
+from flask import Flask, Blueprint, request, jsonify, make_response, g, has_request_context, current_app
 from flask_cors import CORS  # Import CORS
 from pymongo import MongoClient
+from pymongo.errors import DuplicateKeyError
 from bson.objectid import ObjectId
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from jwt import JWT
+from jwt.exceptions import JWTException
+from jwt.jwk import OctetJWK
+from jwt.utils import get_int_from_datetime
 import bcrypt
 import os
+import secrets
+import threading
+import time
+import uuid
 from dotenv import load_dotenv
+from werkzeug.local import LocalProxy
+from metrics import init_metrics, record_bcrypt
 
 # Load environment variables
 load_dotenv()
 
-app = Flask(__name__)
+# Routes are registered on this blueprint; create_app() builds the Flask app
+bp = Blueprint("users", __name__)
+
+# MongoDB connection settings, read from .env. Each worker process gets its own pool of up to MONGO_MAX_POOL_SIZE connections.
+MONGO_CONFIG = {
+    "MONGO_URI": os.getenv("MONGO_URI"),
+    "MONGO_MAX_POOL_SIZE": int(os.getenv("MONGO_MAX_POOL_SIZE", "100")),
+    "MONGO_MIN_POOL_SIZE": int(os.getenv("MONGO_MIN_POOL_SIZE", "0")),
+    # How long a request waits for a free pooled connection before failing
+    "MONGO_WAIT_QUEUE_TIMEOUT_MS": int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "2000")),
+    # How long to wait for a reachable MongoDB server before failing
+    "MONGO_SERVER_SELECTION_TIMEOUT_MS": int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000")),
+    # Create indexes when the app is created (set to false to skip that work at startup)
+    "MONGO_CREATE_INDEXES": os.getenv("MONGO_CREATE_INDEXES", "true").lower() == "true"
+}
+
+# Helper function to turn the MONGO_* settings into MongoClient / AsyncMongoClient options
+def mongo_client_options(config):
+    return {
+        "maxPoolSize": config["MONGO_MAX_POOL_SIZE"],
+        "minPoolSize": config["MONGO_MIN_POOL_SIZE"],
+        "waitQueueTimeoutMS": config["MONGO_WAIT_QUEUE_TIMEOUT_MS"],
+        "serverSelectionTimeoutMS": config["MONGO_SERVER_SELECTION_TIMEOUT_MS"]
+    }
 
-# Enable CORS for specific routes (for admin)
-CORS(app, origins="http://localhost:5173", methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"])
+mongo_client_lock = threading.Lock()
+
+# Helper function to get the app's MongoDB client.
+# The client is created on first use in each process, so workers forked by gunicorn never share one.
+def get_client():
+    app = current_app._get_current_object()
+    pid, client = app.extensions.get("mongo_client", (None, None))
+    if pid != os.getpid():
+        with mongo_client_lock:
+            pid, client = app.extensions.get("mongo_client", (None, None))
+            if pid != os.getpid():
+                client = MongoClient(app.config["MONGO_URI"], **mongo_client_options(app.config))
+                app.extensions["mongo_client"] = (os.getpid(), client)
+    return client
+
+# Helper function to close the app's MongoDB client in this process (the next get_client() opens a new one)
+def close_client():
+    app = current_app._get_current_object()
+    with mongo_client_lock:
+        pid, client = app.extensions.pop("mongo_client", (None, None))
+    if client is not None and pid == os.getpid():
+        client.close()
+
+# Helper function to get the database
+def get_db():
+    return get_client().expense_manager  # Database name
+
+users_collection = LocalProxy(lambda: get_db().users)  # Collection name for users
+revoked_tokens_collection = LocalProxy(lambda: get_db().revoked_tokens)  # Token IDs revoked by /logout
+
+# Create the indexes (create_index is a no-op if they exist)
+def ensure_indexes():
+    # Usernames are unique, so inserts don't need to look for an existing user first
+    users_collection.create_index("username", unique=True)
+    # Revoked token IDs are removed by MongoDB once the token would have expired anyway
+    revoked_tokens_collection.create_index("expires_at", expireAfterSeconds=0)
+
+# Fields read from user documents (the password hash is only read to check a login)
+USER_FIELDS = {"username": 1, "role": 1}
+LOGIN_FIELDS = {"username": 1, "role": 1, "password": 1}
+
+# Pagination settings for listing users
+DEFAULT_USERS_PAGE_SIZE = 100
+MAX_USERS_PAGE_SIZE = 1000
+
+# Helper function to build the GET /admin/users query and page size from the "limit" and "after" query parameters
+def build_users_page_query(args):
+    limit = args.get("limit", DEFAULT_USERS_PAGE_SIZE, type=int)
+    if limit < 1 or limit > MAX_USERS_PAGE_SIZE:
+        raise ValueError(f"limit must be between 1 and {MAX_USERS_PAGE_SIZE}")
+
+    query = {}
+    after = args.get("after")
+    if after:
+        if not ObjectId.is_valid(after):
+            raise ValueError("Invalid cursor")
+        query["_id"] = {"$gt": ObjectId(after)}
+    return query, limit
+
+# Helper function to build the GET /admin/users response from up to limit + 1 user documents
+def build_users_page(users, limit):
+    users_list = []
+    next_cursor = None
+    for user in users:
+        if len(users_list) == limit:
+            next_cursor = users_list[-1]["_id"]
+            break
+        users_list.append({"_id": str(user["_id"]), "username": user["username"], "role": user["role"]})
+    return {"users": users_list, "next_cursor": next_cursor}
+
+# Session token settings. Set JWT_SECRET in .env so tokens survive restarts and work across workers.
+JWT_SECRET = os.getenv("JWT_SECRET")
+JWT_SECRET_GENERATED = not JWT_SECRET
+if JWT_SECRET_GENERATED:
+    JWT_SECRET = secrets.token_hex(32)
+JWT_TTL_SECONDS = int(os.getenv("JWT_TTL_SECONDS", "900"))
+# How long a verified token is trusted before the revocation list is checked again
+TOKEN_CACHE_SECONDS = int(os.getenv("TOKEN_CACHE_SECONDS", "60"))
+TOKEN_CACHE_SIZE = 10000
+
+jwt_instance = JWT()
+signing_key = OctetJWK(JWT_SECRET.encode('utf-8'))
+token_cache = OrderedDict()  # token -> (claims, trusted until)
+token_cache_lock = threading.Lock()
+
+# Password hashing settings. Hashing runs on a fixed-size pool so a burst of logins cannot starve other routes.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(os.cpu_count() or 1)))
+# Maximum hashing jobs running or waiting at once; more than this gets a 503
+HASH_QUEUE_LIMIT = int(os.getenv("HASH_QUEUE_LIMIT", str(HASH_WORKERS * 4)))
+HASH_RETRY_AFTER_SECONDS = 1
+
+hash_pool = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="bcrypt")
+hash_slots = threading.BoundedSemaphore(HASH_QUEUE_LIMIT)
+
+# Raised when the hashing queue is full
+class HashPoolBusy(Exception):
+    pass
+
+@bp.app_errorhandler(HashPoolBusy)
+def hash_pool_busy(e):
+    response = jsonify({"message": "Server busy, please try again"})
+    response.headers["Retry-After"] = str(HASH_RETRY_AFTER_SECONDS)
+    return response, 503
+
+# Helper function to queue a bcrypt call on the hashing pool.
+# The future's result is (result, seconds spent waiting in the queue, seconds spent hashing).
+def submit_hash_job(func, *args):
+    if not hash_slots.acquire(blocking=False):
+        raise HashPoolBusy()
+    submitted = time.perf_counter()
+
+    def job():
+        started = time.perf_counter()
+        try:
+            return func(*args), started - submitted, time.perf_counter() - started
+        finally:
+            hash_slots.release()
 
-# Connect to MongoDB using the URI from .env file
-client = MongoClient(os.getenv("MONGO_URI"))
-db = client.expense_manager  # Database name
-users_collection = db.users  # Collection name for users
+    try:
+        return hash_pool.submit(job)
+    except Exception:
+        hash_slots.release()
+        raise
+
+# Helper function to run a bcrypt call on the hashing pool and wait for the result
+def run_hash_job(func, *args):
+    result, queue_wait, hash_time = submit_hash_job(func, *args).result()
+    record_hash_timing(queue_wait, hash_time)
+    record_bcrypt(func.__name__, queue_wait, hash_time)
+    return result
+
+# Helper function to add hashing time to the current request (reported in the Server-Timing header)
+def record_hash_timing(queue_wait, hash_time):
+    if has_request_context():
+        g.hash_queue_wait = g.get("hash_queue_wait", 0) + queue_wait
+        g.hash_time = g.get("hash_time", 0) + hash_time
+
+@bp.after_app_request
+def add_hash_timing_header(response):
+    if "hash_time" in g:
+        response.headers["Server-Timing"] = (
+            f"hash-queue;dur={g.hash_queue_wait * 1000:.1f}, hash;dur={g.hash_time * 1000:.1f}"
+        )
+    return response
 
 # Helper function to hash passwords
 def hash_password(password):
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+    return run_hash_job(bcrypt.hashpw, password.encode('utf-8'), bcrypt.gensalt(rounds=BCRYPT_ROUNDS))
 
 # Helper function to check password
 def check_password(stored_password, input_password):
-    return bcrypt.checkpw(input_password.encode('utf-8'), stored_password)
+    return run_hash_job(bcrypt.checkpw, input_password.encode('utf-8'), stored_password)
+
+# Helper function to check if a stored hash uses fewer rounds than BCRYPT_ROUNDS
+def needs_rehash(stored_password):
+    try:
+        return int(stored_password.split(b"$")[2]) < BCRYPT_ROUNDS
+    except (AttributeError, IndexError, ValueError):
+        return False
+
+# Helper function to rehash a password with the current cost after a successful login.
+# Runs in the background and is skipped if the hashing queue is busy (it will be retried on the next login).
+def upgrade_password_hash(user, password):
+    if not needs_rehash(user["password"]):
+        return
+    try:
+        future = submit_hash_job(bcrypt.hashpw, password.encode('utf-8'), bcrypt.gensalt(rounds=BCRYPT_ROUNDS))
+    except HashPoolBusy:
+        return
+
+    # The callback runs on a pool thread, outside the app context
+    collection = users_collection._get_current_object()
+
+    def save(done):
+        # Only replace the hash we checked, in case the password was changed meanwhile
+        collection.update_one(
+            {"_id": user["_id"], "password": user["password"]},
+            {"$set": {"password": done.result()[0]}}
+        )
+
+    future.add_done_callback(save)
+
+# Helper function to issue a signed session token for a user
+def issue_token(user):
+    now = datetime.now(timezone.utc)
+    claims = {
+        "sub": str(user["_id"]),
+        "username": user["username"],
+        "role": user["role"],
+        "jti": uuid.uuid4().hex,
+        "iat": get_int_from_datetime(now),
+        "exp": get_int_from_datetime(now + timedelta(seconds=JWT_TTL_SECONDS))
+    }
+    return jwt_instance.encode(claims, signing_key, alg='HS256')
+
+# Helper function to get the claims of a recently verified token, or None
+def get_cached_claims(token):
+    with token_cache_lock:
+        cached = token_cache.get(token)
+        if cached and cached[1] > time.time():
+            token_cache.move_to_end(token)
+            return cached[0]
+        token_cache.pop(token, None)
+        return None
+
+# Helper function to check a token's signature and expiry and return its claims
+def decode_token(token):
+    try:
+        return jwt_instance.decode(token, signing_key, algorithms={'HS256'})
+    # Malformed tokens (bad base64 or JSON, a header that is not an object or has no "alg") fail in the jwt
+    # package with plain Python errors before the signature is checked
+    except (JWTException, ValueError, TypeError, KeyError):
+        raise PermissionError("Invalid token")
+
+# Helper function to remember a verified token until it expires or TOKEN_CACHE_SECONDS pass
+def cache_claims(token, claims):
+    with token_cache_lock:
+        token_cache[token] = (claims, min(claims["exp"], time.time() + TOKEN_CACHE_SECONDS))
+        token_cache.move_to_end(token)
+        if len(token_cache) > TOKEN_CACHE_SIZE:
+            token_cache.popitem(last=False)
+
+# Helper function to stop trusting a cached token (after it is revoked)
+def forget_token(token):
+    with token_cache_lock:
+        token_cache.pop(token, None)
+
+# Helper function to verify a session token and return its claims
+def verify_token(token):
+    claims = get_cached_claims(token)
+    if claims:
+        return claims
+
+    claims = decode_token(token)
+    if revoked_tokens_collection.find_one({"_id": claims["jti"]}, {"_id": 1}):
+        raise PermissionError("Token revoked")
+
+    cache_claims(token, claims)
+    return claims
+
+# Helper function to get the bearer token sent with the request
+def get_request_token():
+    header = request.headers.get('Authorization', '')
+    if not header.startswith('Bearer '):
+        raise PermissionError("Missing token")
+    return header[len('Bearer '):].strip()
+
+# Readiness check - can the service reach MongoDB (also opens the first pooled connection)
+@bp.route('/ready', methods=['GET'])
+def readiness_check():
+    try:
+        get_client().admin.command("ping")
+        return jsonify({"message": "User service is ready"}), 200
+    except Exception as e:
+        return jsonify({"message": f"MongoDB is not reachable: {str(e)}"}), 503
 
 # User Registration
-@app.route('/register', methods=['POST'])
+@bp.route('/register', methods=['POST'])
 def register_user():
     data = request.get_json()
     username = data.get('username')
@@ -37,10 +315,6 @@ def register_user():
     if not username or not password:
         return jsonify({"message": "Username and password are required"}), 400
 
-    # Check if user already exists
-    if users_collection.find_one({"username": username}):
-        return jsonify({"message": "Username already taken"}), 400
-
     hashed_password = hash_password(password)
 
     new_user = {
@@ -49,11 +323,15 @@ def register_user():
         "role": "user"  # Default role is 'user'
     }
 
-    users_collection.insert_one(new_user)
+    # The unique index on username rejects a name that is already taken
+    try:
+        users_collection.insert_one(new_user)
+    except DuplicateKeyError:
+        return jsonify({"message": "Username already taken"}), 400
     return jsonify({"message": "User registered successfully"}), 201
 
 # User Login
-@app.route('/login', methods=['POST'])
+@bp.route('/login', methods=['POST'])
 def login_user():
     data = request.get_json()
     username = data.get('username')
@@ -62,15 +340,16 @@ def login_user():
     if not username or not password:
         return jsonify({"message": "Username and password are required"}), 400
 
-    user = users_collection.find_one({"username": username})
+    user = users_collection.find_one({"username": username}, LOGIN_FIELDS)
 
     if not user or not check_password(user["password"], password):
         return jsonify({"message": "Invalid username or password"}), 401
 
-    return jsonify({"message": "Login successful"}), 200
+    upgrade_password_hash(user, password)
+    return jsonify({"message": "Login successful", "token": issue_token(user)}), 200
 
 # Admin Registration
-@app.route('/admin/register', methods=['POST'])
+@bp.route('/admin/register', methods=['POST'])
 def register_admin():
     data = request.get_json()
     username = data.get('username')
@@ -79,9 +358,6 @@ def register_admin():
     if not username or not password:
         return jsonify({"message": "Username and password are required"}), 400
 
-    if users_collection.find_one({"username": username}):
-        return jsonify({"message": "Username already taken"}), 400
-
     hashed_password = hash_password(password)
 
     new_admin = {
@@ -90,11 +366,14 @@ def register_admin():
         "role": "admin"
     }
 
-    users_collection.insert_one(new_admin)
+    try:
+        users_collection.insert_one(new_admin)
+    except DuplicateKeyError:
+        return jsonify({"message": "Username already taken"}), 400
     return jsonify({"message": "Admin registered successfully"}), 201
 
 # Admin Login
-@app.route('/admin/login', methods=['POST'])
+@bp.route('/admin/login', methods=['POST'])
 def login_admin():
     data = request.get_json()
     username = data.get('username')
@@ -103,31 +382,51 @@ def login_admin():
     if not username or not password:
         return jsonify({"message": "Username and password are required"}), 400
 
-    admin = users_collection.find_one({"username": username, "role": "admin"})
+    admin = users_collection.find_one({"username": username, "role": "admin"}, LOGIN_FIELDS)
 
     if not admin or not check_password(admin["password"], password):
         return jsonify({"message": "Invalid admin credentials"}), 401
 
-    return jsonify({"message": "Admin login successful"}), 200
+    upgrade_password_hash(admin, password)
+    return jsonify({"message": "Admin login successful", "token": issue_token(admin)}), 200
 
-# Admin CRUD - Get All Users and Admins
-@app.route('/admin/users', methods=['GET'])
+# Logout - revoke the session token sent with the request
+@bp.route('/logout', methods=['POST'])
+def logout():
+    try:
+        token = get_request_token()
+        claims = verify_token(token)
+    except PermissionError:
+        return jsonify({"message": "Invalid token"}), 401
+
+    revoked_tokens_collection.update_one(
+        {"_id": claims["jti"]},
+        {"$set": {"expires_at": datetime.fromtimestamp(claims["exp"], timezone.utc)}},
+        upsert=True
+    )
+    forget_token(token)
+    return jsonify({"message": "Logout successful"}), 200
+
+# Admin CRUD - Get All Users and Admins, one page at a time (ordered by _id)
+@bp.route('/admin/users', methods=['GET'])
 def get_users_and_admins():
     try:
-        admin_username = request.headers.get('admin_username')
-        admin_password = request.headers.get('admin_password')
         # Admin authentication
-        admin_authenticate(admin_username, admin_password)
+        admin_authenticate()
 
-        users = users_collection.find()
-        users_list = [{"_id": str(user["_id"]), "username": user["username"], "role": user["role"]} for user in users]
+        try:
+            query, limit = build_users_page_query(request.args)
+        except ValueError as e:
+            return jsonify({"message": str(e)}), 400
 
-        return jsonify(users_list), 200
+        # Fetch one extra user to know whether another page exists
+        users = users_collection.find(query, USER_FIELDS).sort("_id", 1).limit(limit + 1)
+        return jsonify(build_users_page(users, limit)), 200
     except PermissionError:
         return jsonify({"message": "Invalid admin credentials"}), 403
 
 # Admin CRUD - Create User
-@app.route('/admin/user', methods=['POST'])
+@bp.route('/admin/user', methods=['POST'])
 def create_user():
     data = request.get_json()
     username = data.get('username')
@@ -135,7 +434,7 @@ def create_user():
 
     # Admin authentication
     try:
-        admin_authenticate(data.get('admin_username'), data.get('admin_password'))
+        admin_authenticate()
     except PermissionError:
         return jsonify({"message": "Invalid admin credentials"}), 403
 
@@ -143,10 +442,6 @@ def create_user():
     if not username or not password:
         return jsonify({"message": "Username and password are required"}), 400
 
-    # Check if the user already exists
-    if users_collection.find_one({"username": username}):
-        return jsonify({"message": "Username already taken"}), 400
-
     # Hash the password
     hashed_password = hash_password(password)
 
@@ -157,35 +452,30 @@ def create_user():
         "role": "user"
     }
 
-    # Insert new user into the database
-    result = users_collection.insert_one(new_user)
-
-    # Fetch the newly created user to return their details in the response
-    created_user = users_collection.find_one({"_id": result.inserted_id})
-
-    # Remove password from the response data for security reasons
-    created_user.pop('password', None)
+    # Insert new user into the database (the unique index on username rejects a name that is already taken)
+    try:
+        result = users_collection.insert_one(new_user)
+    except DuplicateKeyError:
+        return jsonify({"message": "Username already taken"}), 400
 
-    # Return a response with the message and created user details, including _id
+    # Return a response with the message and created user details, including _id (but not the password)
     return jsonify({
         "message": "User created by admin",
         "user": {
-            "id": str(created_user["_id"]),  # Include MongoDB ObjectId as a string
-            "username": created_user["username"],
-            "role": created_user["role"]
+            "id": str(result.inserted_id),  # Include MongoDB ObjectId as a string
+            "username": new_user["username"],
+            "role": new_user["role"]
         }
     }), 201
 
 # Admin CRUD - Read User
-@app.route('/admin/user/<user_id>', methods=['GET'])
+@bp.route('/admin/user/<user_id>', methods=['GET'])
 def read_user(user_id):
     try:
-        admin_username = request.headers.get('admin_username')
-        admin_password = request.headers.get('admin_password')
         # Admin authentication
-        admin_authenticate(admin_username, admin_password)
+        admin_authenticate()
 
-        user = users_collection.find_one({"_id": ObjectId(user_id)})
+        user = users_collection.find_one({"_id": ObjectId(user_id)}, USER_FIELDS)
 
         if not user:
             return jsonify({"message": "User not found"}), 404
@@ -198,21 +488,24 @@ def read_user(user_id):
         return jsonify({"message": "Invalid admin credentials"}), 403
 
 # Admin CRUD - Update User
-@app.route('/admin/user/<user_id>', methods=['PUT'])
+@bp.route('/admin/user/<user_id>', methods=['PUT'])
 def update_user(user_id):
-    data = request.get_json()
     try:
-        admin_authenticate(data.get('admin_username'), data.get('admin_password'))
+        admin_authenticate()
     except PermissionError:
         return jsonify({"message": "Invalid admin credentials"}), 403
 
+    data = request.get_json()
     updated_data = {}
     if 'username' in data:
         updated_data["username"] = data['username']
     if 'password' in data:
         updated_data["password"] = hash_password(data['password'])
 
-    result = users_collection.update_one({"_id": ObjectId(user_id)}, {"$set": updated_data})
+    try:
+        result = users_collection.update_one({"_id": ObjectId(user_id)}, {"$set": updated_data})
+    except DuplicateKeyError:
+        return jsonify({"message": "Username already taken"}), 400
 
     if result.matched_count == 0:
         return jsonify({"message": "User not found"}), 404
@@ -220,10 +513,10 @@ def update_user(user_id):
     return jsonify({"message": "User updated successfully"}), 200
 
 # Admin CRUD - Delete User
-@app.route('/admin/user/<user_id>', methods=['DELETE'])
+@bp.route('/admin/user/<user_id>', methods=['DELETE'])
 def delete_user(user_id):
     try:
-        admin_authenticate(request.args.get('admin_username'), request.args.get('admin_password'))
+        admin_authenticate()
     except PermissionError:
         return jsonify({"message": "Invalid admin credentials"}), 403
 
@@ -234,12 +527,48 @@ def delete_user(user_id):
 
     return jsonify({"message": "User deleted successfully"}), 200
 
-# Helper function to authenticate admin
-def admin_authenticate(username, password):
-    admin = users_collection.find_one({"username": username, "role": "admin"})
+# Helper function to authenticate admin from the session token issued by /admin/login
+def admin_authenticate():
+    claims = verify_token(get_request_token())
 
-    if not admin or not check_password(admin["password"], password):
+    if claims.get("role") != "admin":
         raise PermissionError("Invalid admin credentials")
+    return claims
+
+# Build the Flask app. Extra settings (e.g. MONGO_MAX_POOL_SIZE) can be passed in config.
+# Production entry point: gunicorn -c gunicorn.conf.py (see gunicorn.conf.py)
+# Helper function to refuse to start without JWT_SECRET outside debug mode. A random secret is only valid in
+# the process that generated it, so its tokens would be rejected by other workers and by the async app.
+def check_jwt_secret(logger, debug):
+    if not JWT_SECRET_GENERATED:
+        return
+    if not debug:
+        raise RuntimeError("JWT_SECRET is not set. Add it to .env, e.g. the output of: "
+                           "python -c \"import secrets; print(secrets.token_hex(32))\"")
+    logger.warning("JWT_SECRET is not set: using a random secret, so tokens are only valid in this process "
+                   "until it restarts")
+
+def create_app(config=None):
+    app = Flask(__name__)
+    app.config.update(MONGO_CONFIG)
+    if config:
+        app.config.update(config)
+
+    # Enable CORS for specific routes (for admin)
+    CORS(app, origins="http://localhost:5173", methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"])
+
+    check_jwt_secret(app.logger, app.debug)
+
+    app.register_blueprint(bp)
+    init_metrics(app)
+
+    if app.config["MONGO_CREATE_INDEXES"]:
+        with app.app_context():
+            ensure_indexes()
+            # With gunicorn's preload_app this runs in the master process; don't keep its client (and its
+            # monitor threads and pooled connections) open there, each worker opens its own after the fork
+            close_client()
+    return app
 
 if __name__ == '__main__':
-    app.run(debug=True)
+    create_app().run(debug=os.getenv("FLASK_DEBUG") == "1")
@@ -0,0 +1,378 @@
+from quart import Quart, request, jsonify, g
+from quart_cors import cors
+from pymongo import AsyncMongoClient
+from pymongo.errors import DuplicateKeyError
+from bson.objectid import ObjectId
+from datetime import datetime, timezone
+import asyncio
+import os
+import bcrypt
+from dotenv import load_dotenv
+from metrics import init_async_metrics, record_bcrypt
+
+# Token handling and the bcrypt worker pool are shared with the Flask app
+from app import (
+    BCRYPT_ROUNDS,
+    HASH_RETRY_AFTER_SECONDS,
+    HashPoolBusy,
+    LOGIN_FIELDS,
+    MONGO_CONFIG,
+    USER_FIELDS,
+    build_users_page,
+    build_users_page_query,
+    cache_claims,
+    check_jwt_secret,
+    decode_token,
+    forget_token,
+    get_cached_claims,
+    issue_token,
+    mongo_client_options,
+    needs_rehash,
+    submit_hash_job
+)
+
+# Load environment variables
+load_dotenv()
+
+# Async version of the user service (same routes and responses as app.py), served with an ASGI server:
+# hypercorn asgi_app:app --bind localhost:5000
+app = Quart(__name__)
+check_jwt_secret(app.logger, os.getenv("QUART_DEBUG") == "1")
+
+# Enable CORS for specific routes (for admin)
+app = cors(app, allow_origin="http://localhost:5173", allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"])
+
+# Request and MongoDB metrics on /metrics (only if METRICS_ENABLED)
+init_async_metrics(app)
+
+# MongoDB collections, set up once the server has started (in each worker process)
+client = None
+users_collection = None
+revoked_tokens_collection = None
+
+@app.before_serving
+async def connect_to_mongo():
+    global client, users_collection, revoked_tokens_collection
+    client = AsyncMongoClient(MONGO_CONFIG["MONGO_URI"], **mongo_client_options(MONGO_CONFIG))
+    db = client.expense_manager  # Database name
+    users_collection = db.users
+    revoked_tokens_collection = db.revoked_tokens
+    if MONGO_CONFIG["MONGO_CREATE_INDEXES"]:
+        await users_collection.create_index("username", unique=True)
+        await revoked_tokens_collection.create_index("expires_at", expireAfterSeconds=0)
+
+@app.after_serving
+async def close_mongo():
+    await client.close()
+
+@app.errorhandler(HashPoolBusy)
+async def hash_pool_busy(e):
+    response = jsonify({"message": "Server busy, please try again"})
+    response.headers["Retry-After"] = str(HASH_RETRY_AFTER_SECONDS)
+    return response, 503
+
+# Helper function to run a bcrypt call on the hashing pool without blocking the event loop
+async def run_hash_job(func, *args):
+    result, queue_wait, hash_time = await asyncio.wrap_future(submit_hash_job(func, *args))
+    record_bcrypt(func.__name__, queue_wait, hash_time)
+    g.hash_queue_wait = g.get("hash_queue_wait", 0) + queue_wait
+    g.hash_time = g.get("hash_time", 0) + hash_time
+    return result
+
+@app.after_request
+async def add_hash_timing_header(response):
+    if "hash_time" in g:
+        response.headers["Server-Timing"] = (
+            f"hash-queue;dur={g.hash_queue_wait * 1000:.1f}, hash;dur={g.hash_time * 1000:.1f}"
+        )
+    return response
+
+# Helper function to hash passwords
+async def hash_password(password):
+    return await run_hash_job(bcrypt.hashpw, password.encode('utf-8'), bcrypt.gensalt(rounds=BCRYPT_ROUNDS))
+
+# Helper function to check password
+async def check_password(stored_password, input_password):
+    return await run_hash_job(bcrypt.checkpw, input_password.encode('utf-8'), stored_password)
+
+# Helper function to rehash a password with the current cost after a successful login.
+# Runs in the background and is skipped if the hashing queue is busy (it will be retried on the next login).
+def upgrade_password_hash(user, password):
+    if not needs_rehash(user["password"]):
+        return
+    try:
+        future = submit_hash_job(bcrypt.hashpw, password.encode('utf-8'), bcrypt.gensalt(rounds=BCRYPT_ROUNDS))
+    except HashPoolBusy:
+        return
+
+    async def save():
+        new_password, _, _ = await asyncio.wrap_future(future)
+        # Only replace the hash we checked, in case the password was changed meanwhile
+        await users_collection.update_one(
+            {"_id": user["_id"], "password": user["password"]},
+            {"$set": {"password": new_password}}
+        )
+
+    app.add_background_task(save)
+
+# Helper function to verify a session token and return its claims
+async def verify_token(token):
+    claims = get_cached_claims(token)
+    if claims:
+        return claims
+
+    claims = decode_token(token)
+    if await revoked_tokens_collection.find_one({"_id": claims["jti"]}, {"_id": 1}):
+        raise PermissionError("Token revoked")
+
+    cache_claims(token, claims)
+    return claims
+
+# Helper function to get the bearer token sent with the request
+def get_request_token():
+    header = request.headers.get('Authorization', '')
+    if not header.startswith('Bearer '):
+        raise PermissionError("Missing token")
+    return header[len('Bearer '):].strip()
+
+# Helper function to authenticate admin from the session token issued by /admin/login
+async def admin_authenticate():
+    claims = await verify_token(get_request_token())
+
+    if claims.get("role") != "admin":
+        raise PermissionError("Invalid admin credentials")
+    return claims
+
+# Readiness check - can the service reach MongoDB (also opens the first pooled connection)
+@app.route('/ready', methods=['GET'])
+async def readiness_check():
+    try:
+        await client.admin.command("ping")
+        return jsonify({"message": "User service is ready"}), 200
+    except Exception as e:
+        return jsonify({"message": f"MongoDB is not reachable: {str(e)}"}), 503
+
+# User Registration
+@app.route('/register', methods=['POST'])
+async def register_user():
+    data = await request.get_json()
+    username = data.get('username')
+    password = data.get('password')
+
+    if not username or not password:
+        return jsonify({"message": "Username and password are required"}), 400
+
+    hashed_password = await hash_password(password)
+
+    new_user = {
+        "username": username,
+        "password": hashed_password,
+        "role": "user"  # Default role is 'user'
+    }
+
+    # The unique index on username rejects a name that is already taken
+    try:
+        await users_collection.insert_one(new_user)
+    except DuplicateKeyError:
+        return jsonify({"message": "Username already taken"}), 400
+    return jsonify({"message": "User registered successfully"}), 201
+
+# User Login
+@app.route('/login', methods=['POST'])
+async def login_user():
+    data = await request.get_json()
+    username = data.get('username')
+    password = data.get('password')
+
+    if not username or not password:
+        return jsonify({"message": "Username and password are required"}), 400
+
+    user = await users_collection.find_one({"username": username}, LOGIN_FIELDS)
+
+    if not user or not await check_password(user["password"], password):
+        return jsonify({"message": "Invalid username or password"}), 401
+
+    upgrade_password_hash(user, password)
+    return jsonify({"message": "Login successful", "token": issue_token(user)}), 200
+
+# Admin Registration
+@app.route('/admin/register', methods=['POST'])
+async def register_admin():
+    data = await request.get_json()
+    username = data.get('username')
+    password = data.get('password')
+
+    if not username or not password:
+        return jsonify({"message": "Username and password are required"}), 400
+
+    hashed_password = await hash_password(password)
+
+    new_admin = {
+        "username": username,
+        "password": hashed_password,
+        "role": "admin"
+    }
+
+    try:
+        await users_collection.insert_one(new_admin)
+    except DuplicateKeyError:
+        return jsonify({"message": "Username already taken"}), 400
+    return jsonify({"message": "Admin registered successfully"}), 201
+
+# Admin Login
+@app.route('/admin/login', methods=['POST'])
+async def login_admin():
+    data = await request.get_json()
+    username = data.get('username')
+    password = data.get('password')
+
+    if not username or not password:
+        return jsonify({"message": "Username and password are required"}), 400
+
+    admin = await users_collection.find_one({"username": username, "role": "admin"}, LOGIN_FIELDS)
+
+    if not admin or not await check_password(admin["password"], password):
+        return jsonify({"message": "Invalid admin credentials"}), 401
+
+    upgrade_password_hash(admin, password)
+    return jsonify({"message": "Admin login successful", "token": issue_token(admin)}), 200
+
+# Logout - revoke the session token sent with the request
+@app.route('/logout', methods=['POST'])
+async def logout():
+    try:
+        token = get_request_token()
+        claims = await verify_token(token)
+    except PermissionError:
+        return jsonify({"message": "Invalid token"}), 401
+
+    await revoked_tokens_collection.update_one(
+        {"_id": claims["jti"]},
+        {"$set": {"expires_at": datetime.fromtimestamp(claims["exp"], timezone.utc)}},
+        upsert=True
+    )
+    forget_token(token)
+    return jsonify({"message": "Logout successful"}), 200
+
+# Admin CRUD - Get All Users and Admins, one page at a time (ordered by _id)
+@app.route('/admin/users', methods=['GET'])
+async def get_users_and_admins():
+    try:
+        # Admin authentication
+        await admin_authenticate()
+
+        try:
+            query, limit = build_users_page_query(request.args)
+        except ValueError as e:
+            return jsonify({"message": str(e)}), 400
+
+        # Fetch one extra user to know whether another page exists
+        users = users_collection.find(query, USER_FIELDS).sort("_id", 1).limit(limit + 1)
+        return jsonify(build_users_page(await users.to_list(), limit)), 200
+    except PermissionError:
+        return jsonify({"message": "Invalid admin credentials"}), 403
+
+# Admin CRUD - Create User
+@app.route('/admin/user', methods=['POST'])
+async def create_user():
+    data = await request.get_json()
+    username = data.get('username')
+    password = data.get('password')
+
+    # Admin authentication
+    try:
+        await admin_authenticate()
+    except PermissionError:
+        return jsonify({"message": "Invalid admin credentials"}), 403
+
+    # Check if username and password are provided
+    if not username or not password:
+        return jsonify({"message": "Username and password are required"}), 400
+
+    # Hash the password
+    hashed_password = await hash_password(password)
+
+    # Create new user object
+    new_user = {
+        "username": username,
+        "password": hashed_password,
+        "role": "user"
+    }
+
+    # Insert new user into the database (the unique index on username rejects a name that is already taken)
+    try:
+        result = await users_collection.insert_one(new_user)
+    except DuplicateKeyError:
+        return jsonify({"message": "Username already taken"}), 400
+
+    # Return a response with the message and created user details, including _id (but not the password)
+    return jsonify({
+        "message": "User created by admin",
+        "user": {
+            "id": str(result.inserted_id),  # Include MongoDB ObjectId as a string
+            "username": new_user["username"],
+            "role": new_user["role"]
+        }
+    }), 201
+
+# Admin CRUD - Read User
+@app.route('/admin/user/<user_id>', methods=['GET'])
+async def read_user(user_id):
+    try:
+        # Admin authentication
+        await admin_authenticate()
+
+        user = await users_collection.find_one({"_id": ObjectId(user_id)}, USER_FIELDS)
+
+        if not user:
+            return jsonify({"message": "User not found"}), 404
+
+        return jsonify({
+            "username": user["username"],
+            "role": user["role"]
+        }), 200
+    except PermissionError:
+        return jsonify({"message": "Invalid admin credentials"}), 403
+
+# Admin CRUD - Update User
+@app.route('/admin/user/<user_id>', methods=['PUT'])
+async def update_user(user_id):
+    try:
+        await admin_authenticate()
+    except PermissionError:
+        return jsonify({"message": "Invalid admin credentials"}), 403
+
+    data = await request.get_json()
+    updated_data = {}
+    if 'username' in data:
+        updated_data["username"] = data['username']
+    if 'password' in data:
+        updated_data["password"] = await hash_password(data['password'])
+
+    try:
+        result = await users_collection.update_one({"_id": ObjectId(user_id)}, {"$set": updated_data})
+    except DuplicateKeyError:
+        return jsonify({"message": "Username already taken"}), 400
+
+    if result.matched_count == 0:
+        return jsonify({"message": "User not found"}), 404
+
+    return jsonify({"message": "User updated successfully"}), 200
+
+# Admin CRUD - Delete User
+@app.route('/admin/user/<user_id>', methods=['DELETE'])
+async def delete_user(user_id):
+    try:
+        await admin_authenticate()
+    except PermissionError:
+        return jsonify({"message": "Invalid admin credentials"}), 403
+
+    result = await users_collection.delete_one({"_id": ObjectId(user_id)})
+
+    if result.deleted_count == 0:
+        return jsonify({"message": "User not found"}), 404
+
+    return jsonify({"message": "User deleted successfully"}), 200
+
+if __name__ == '__main__':
+    app.run(debug=False)
@@ -0,0 +1,26 @@
+# Gunicorn settings for running the service in production (Linux/macOS):
+# gunicorn -c gunicorn.conf.py
+import multiprocessing
+import os
+from dotenv import load_dotenv
+
+# Read .env before the settings below (the app does the same when it is imported)
+load_dotenv()
+
+# create_app() is called once and the workers are forked from it.
+# Each worker opens its own MongoDB connection pool on first use, so preloading is fork-safe.
+wsgi_app = "app:create_app()"
+preload_app = True
+
+bind = os.getenv("BIND", "localhost:5000")
+workers = int(os.getenv("WEB_CONCURRENCY", str(multiprocessing.cpu_count() * 2 + 1)))
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "30"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+
+
+# With PROMETHEUS_MULTIPROC_DIR set, drop the metrics of workers that have exited
+def child_exit(server, worker):
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)